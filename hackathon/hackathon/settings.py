@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -120,3 +121,10 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Metrics endpoint (hackathon/views.py)
+# Clients must send "Authorization: Bearer <METRICS_TOKEN>". Without a token
+# the endpoint only answers localhost, and only while DEBUG is on.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_MAX_SOURCES = 32
+METRICS_MAX_BODY_BYTES = 256 * 1024
@@ -0,0 +1,68 @@
+"""
+Metrics endpoint for the simulation's instrumentation
+
+simulation/sim.py --metrics-url http://127.0.0.1:8000/metrics/ POSTs
+{"source": ..., "metrics": {...}} after a run; GET returns the latest
+snapshot of every source. Snapshots are kept in memory only.
+
+Requests need the METRICS_TOKEN bearer token, or come from localhost while
+DEBUG is on if no token is configured. At most METRICS_MAX_SOURCES sources
+are kept and bodies over METRICS_MAX_BODY_BYTES are refused.
+"""
+
+import hmac
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+MAX_SOURCE_LENGTH = 64
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def _authorized(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+    return settings.DEBUG and request.META.get("REMOTE_ADDR") in LOCAL_ADDRESSES
+
+
+@csrf_exempt
+def metrics(request):
+    if request.method not in ("GET", "POST"):
+        return HttpResponseNotAllowed(["GET", "POST"])
+    if not _authorized(request):
+        return JsonResponse({"error": "not authorized"}, status=403)
+    if request.method == "GET":
+        with _lock:
+            return JsonResponse(dict(_snapshots))
+
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > settings.METRICS_MAX_BODY_BYTES:
+        return JsonResponse({"error": "body too large"}, status=413)
+    try:
+        body = request.read(settings.METRICS_MAX_BODY_BYTES + 1)
+        if len(body) > settings.METRICS_MAX_BODY_BYTES:
+            return JsonResponse({"error": "body too large"}, status=413)
+        body = json.loads(body)
+        source = str(body.get("source", "simulation"))
+        snapshot = body["metrics"]
+    except (ValueError, KeyError, AttributeError):
+        return JsonResponse({"error": "expected JSON with a 'metrics' object"}, status=400)
+    if not 0 < len(source) <= MAX_SOURCE_LENGTH:
+        return JsonResponse({"error": f"source must be 1 to {MAX_SOURCE_LENGTH} characters"}, status=400)
+    with _lock:
+        if source not in _snapshots and len(_snapshots) >= settings.METRICS_MAX_SOURCES:
+            return JsonResponse({"error": "too many sources"}, status=429)
+        _snapshots[source] = {"received": time.time(), "metrics": snapshot}
+    return JsonResponse({"ok": True})
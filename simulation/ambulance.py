@@ -1,25 +1,66 @@
+# cv2, sklearn, scipy.spatial and matplotlib are imported inside the functions
+# that need them, so importing this module stays cheap.
+# Folders of frames are processed on a process pool, and every frame's result
+# is cached under a hash of its content and parameters, so re-runs only
+# redo the frames that changed.
+
+import hashlib
+import json
 import numpy as np
-import cv2
 import os
-import matplotlib.pyplot as plt
-from scipy.ndimage import gaussian_filter
-from sklearn.cluster import DBSCAN
-from shapely.geometry import Point, Polygon
-from scipy.spatial import Voronoi, voronoi_plot_2d
+from scipy.ndimage import gaussian_filter, distance_transform_edt
+from frame_store import HeatFrameStore
+import instrumentation as instr
 
 
 def load_heatmap(image_path):
+    import cv2
+
     img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
     if img is None:
         raise ValueError(f"Could not load image at {image_path}")
     return img.astype(float)
 
 
-def extract_cluster_regions(heatmap, eps=10, min_samples=20):
-    points = np.column_stack(np.nonzero(heatmap > heatmap.mean()))
+CLUSTER_METHODS = ('dbscan', 'grid')
+
+
+def extract_cluster_regions(heatmap, eps=10, min_samples=20, method='dbscan'):
+    """
+    Clusters of the above-mean pixels of a heatmap
+
+    Args:
+        eps, min_samples: DBSCAN parameters, eps in pixels
+        method: 'dbscan' runs sklearn DBSCAN on the pixel coordinates;
+            'grid' computes the same kind of clusters with image operations
+            (see grid_cluster_labels), in bounded memory and time linear in
+            the pixel count, for large heatmaps
+
+    Returns:
+        List of (k, 2) arrays of (row, col) points, one per cluster
+    """
+    hot = heatmap > heatmap.mean()
+    if method == 'grid':
+        with instr.span('ambulance.grid_clusters'):
+            labels = grid_cluster_labels(hot, eps, min_samples)
+        rows, cols = np.nonzero(labels)
+        if len(rows) == 0:
+            return []
+        cluster = labels[rows, cols]
+        order = np.argsort(cluster, kind='stable')
+        points = np.column_stack((rows[order], cols[order]))
+        return np.split(points, np.cumsum(np.bincount(cluster)[1:])[:-1])
+    if method != 'dbscan':
+        raise ValueError(f"Unknown clustering method {method!r}, expected one of {CLUSTER_METHODS}")
+
+    from sklearn.cluster import DBSCAN
+
+    points = np.column_stack(np.nonzero(hot))
     if len(points) == 0:
         return []
-    db = DBSCAN(eps=eps, min_samples=min_samples).fit(points)
+    with instr.span('ambulance.dbscan'):
+        db = DBSCAN(eps=eps, min_samples=min_samples).fit(points)
+    instr.observe('ambulance.dbscan_points', len(points))
     labels = db.labels_
     regions = []
     for label in set(labels):
@@ -30,94 +71,211 @@ def extract_cluster_regions(heatmap, eps=10, min_samples=20):
     return regions
 
 
-from scipy.ndimage import binary_dilation, binary_erosion
+def grid_cluster_labels(points, eps, min_samples):
+    """
+    DBSCAN cluster label (1..n, 0 for noise) of every pixel of a boolean image
+
+    - core pixels have at least min_samples points within eps, counted by
+      one FFT convolution with a disk
+    - cores closer than eps are joined: first as connected components, then
+      by unioning the components that meet at each disk offset; only cores
+      within eps of a non-core pixel can meet another component
+    - other points take the cluster of their nearest core if it is within eps
+
+    Cores and clusters are exactly DBSCAN's. Clusters are numbered in raster
+    order of their first core pixel, like DBSCAN over row-major points. Only
+    a border point within eps of two clusters may end up in the other one.
+    """
+    from scipy.ndimage import label
+    from scipy.signal import fftconvolve
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    r = int(eps)
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    in_disk = dy * dy + dx * dx <= eps * eps
+    counts = np.rint(fftconvolve(points.astype(float), in_disk.astype(float), mode='same'))
+    core = points & (counts >= min_samples)
+    if not core.any():
+        return np.zeros(points.shape, dtype=np.int32)
+
+    # Components of touching cores; the structure only links cores within eps
+    if r >= 1:
+        structure = in_disk[r - 1:r + 2, r - 1:r + 2]
+    else:
+        structure = np.zeros((3, 3), dtype=bool)
+        structure[1, 1] = True
+    components, n = label(core, structure=structure)
+
+    # Union components whose cores are within eps, one half-disk offset at a time
+    rows, cols = np.nonzero(core & (distance_transform_edt(core) <= eps))
+    ids = components[rows, cols]
+    height, width = core.shape
+    pairs = []
+    for oy, ox in zip(dy[in_disk], dx[in_disk]):
+        if (oy, ox) <= (0, 0) or (abs(oy) <= 1 and abs(ox) <= 1):
+            continue  # other half of the disk, or already joined by label()
+        tr, tc = rows + oy, cols + ox
+        inside = (tr >= 0) & (tr < height) & (tc >= 0) & (tc < width)
+        other = components[tr[inside], tc[inside]]
+        mine = ids[inside]
+        meet = (other > 0) & (other != mine)
+        if meet.any():
+            pairs.append(np.unique(mine[meet].astype(np.int64) * (n + 1) + other[meet]))
+    if pairs:
+        pairs = np.unique(np.concatenate(pairs))
+        graph = coo_matrix((np.ones(len(pairs)), (pairs // (n + 1), pairs % (n + 1))), shape=(n + 1, n + 1))
+        _, merged = connected_components(graph, directed=False)
+        merged = merged + 1
+        merged[0] = 0  # background
+        components = merged[components]
+
+    # Border points join their nearest core
+    distance, (near_rows, near_cols) = distance_transform_edt(~core, return_indices=True)
+    labels = components[near_rows, near_cols]
+    labels[~points | (distance > eps)] = 0
+
+    # Renumber by first core pixel
+    found, first = np.unique(labels[core], return_index=True)
+    renumber = np.zeros(labels.max() + 1, dtype=np.int32)
+    renumber[found[np.argsort(first)]] = np.arange(1, len(found) + 1)
+    return renumber[labels]
+
+
+def region_borders(shape, regions):
+    """
+    Border pixels of all regions at once
+
+    A pixel is on a border when one of its 4-neighbours belongs to another
+    region (or to none), or when it is a region pixel on the image edge.
+    That is the union over regions of binary_dilation(mask) & ~binary_erosion(mask).
+    """
+    labels = np.zeros(shape, dtype=np.int32)
+    for i, region in enumerate(regions):
+        region = np.asarray(region, dtype=np.intp)
+        labels[region[:, 0], region[:, 1]] = i + 1
+
+    border = np.zeros(shape, dtype=bool)
+    diff = labels[1:, :] != labels[:-1, :]
+    border[1:, :] |= diff
+    border[:-1, :] |= diff
+    diff = labels[:, 1:] != labels[:, :-1]
+    border[:, 1:] |= diff
+    border[:, :-1] |= diff
+    inside = labels > 0
+    border[[0, -1], :] |= inside[[0, -1], :]
+    border[:, [0, -1]] |= inside[:, [0, -1]]
+    return border
+
+
+def _spaced_picks(tree, coords, radius, limit, suppressed):
+    """
+    Walk coords in order and pick every one that is not suppressed, each
+    pick suppressing the coords closer than radius to it. Returns the picked indices.
+    """
+    picks = []
+    i = 0
+    while len(picks) < limit and i < len(coords):
+        i += int(suppressed[i:].argmin())
+        if suppressed[i]:
+            break
+        picks.append(i)
+        if radius > 0:
+            suppressed[tree.query_ball_point(coords[i], np.nextafter(radius, 0))] = True
+        i += 1
+    return picks
+
 
 def density_aware_border_placement(heatmap, regions, num_ambulances, r_min=30):
-    placed = []
-    candidates = []
+    """
+    Place ambulances on the densest region border pixels, at least r_min apart
 
-    for region in regions:
-        mask = np.zeros_like(heatmap, dtype=bool)
-        for y, x in region:
-            mask[int(y), int(x)] = True
+    Candidates are border pixels hotter than the 60th percentile of the
+    heatmap, taken greedily from the hottest down. If fewer than
+    num_ambulances fit, a second pass fills up with spacing r_min / 2.
 
-        border = binary_dilation(mask) & ~binary_erosion(mask)
-        border_coords = np.column_stack(np.nonzero(border))
+    Returns:
+        (k, 2) array of (row, col) positions, k <= num_ambulances
+    """
+    from scipy.spatial import cKDTree
 
-        # Filter border points by density
-        for y, x in border_coords:
-            if heatmap[y, x] > np.percentile(heatmap, 60):
-                candidates.append((y, x, heatmap[y, x]))
+    if len(regions) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+    threshold = np.percentile(heatmap, 60)
+    border = region_borders(heatmap.shape, regions)
+    rows, cols = np.nonzero(border & (heatmap > threshold))
+    if len(rows) == 0:
+        return np.empty((0, 2), dtype=np.intp)
 
-    # Sort by density descending
-    candidates = sorted(candidates, key=lambda tup: -tup[2])
+    # Hottest first; stable, so equal values keep row-major order
+    order = np.argsort(-heatmap[rows, cols], kind='stable')
+    coords = np.column_stack((rows[order], cols[order]))
+    tree = cKDTree(coords)
 
-    for y, x, _ in candidates:
-        if len(placed) >= num_ambulances:
-            break
-        allow = True
-        for py, px in placed:
-            if np.linalg.norm([y - py, x - px]) < r_min:
-                allow = False
-                break
-        if allow:
-            placed.append((y, x))
+    picks = _spaced_picks(tree, coords, r_min, num_ambulances, np.zeros(len(coords), dtype=bool))
 
     # Fallback with looser spacing if not enough placed
-    if len(placed) < num_ambulances:
-        for y, x, _ in candidates:
-            if len(placed) >= num_ambulances:
-                break
-            allow = True
-            for py, px in placed:
-                if np.linalg.norm([y - py, x - px]) < r_min / 2:
-                    allow = False
-                    break
-            if allow:
-                placed.append((y, x))
-
-    return np.array(placed)
+    if len(picks) < num_ambulances:
+        suppressed = np.zeros(len(coords), dtype=bool)
+        suppressed[picks] = True
+        if r_min > 0:
+            for near in tree.query_ball_point(coords[picks], np.nextafter(r_min / 2, 0)):
+                suppressed[near] = True
+        picks += _spaced_picks(tree, coords, r_min / 2, num_ambulances - len(picks), suppressed)
+
+    return coords[picks]
+
+def nearest_station_map(shape, positions):
+    """
+    Index of the nearest station for every pixel (the discrete Voronoi diagram)
+
+    One exact Euclidean distance transform from all stations at once, so the
+    cost is linear in the pixel count however many stations there are.
+    Positions are (row, col) and are rounded and clipped to the image.
+    """
+    positions = np.clip(np.rint(np.asarray(positions)).astype(np.intp), 0, np.array(shape) - 1)
+    station = np.full(shape, -1, dtype=np.intp)
+    # Later duplicates win, so a station sharing a pixel with another gets no cells
+    station[positions[:, 0], positions[:, 1]] = np.arange(len(positions))
+    rows, cols = distance_transform_edt(station < 0, return_distances=False, return_indices=True)
+    return station[rows, cols]
 
-def allocate_resources(heatmap, ambulance_positions):
-    if len(ambulance_positions) < 4:
-        return np.ones(len(ambulance_positions)), ambulance_positions
 
-    vor = Voronoi(ambulance_positions)
-    cell_densities = []
-    valid_positions = []
+def allocate_resources(heatmap, ambulance_positions):
+    """
+    Resources (1-10) per ambulance, proportional to the heat in its Voronoi cell
 
-    from matplotlib.path import Path
+    Every station gets an allocation, including those on the edge whose
+    Voronoi cells are unbounded.
 
-    def points_in_polygon(shape, polygon):
-        h, w = shape
-        y, x = np.mgrid[:h, :w]
-        points = np.column_stack((x.ravel(), y.ravel()))
-        path = Path(polygon)
-        mask = path.contains_points(points)
-        return mask.reshape(shape)
+    Returns:
+        resources, positions (the ambulance_positions as an array)
+    """
+    positions = np.asarray(ambulance_positions)
+    if len(positions) == 0:
+        return np.ones(0), positions
 
-    for i, region_idx in enumerate(vor.point_region):
-        vertices = vor.regions[region_idx]
-        if -1 not in vertices and len(vertices) > 0:
-            polygon = [vor.vertices[v] for v in vertices]
-            mask = points_in_polygon(heatmap.shape, polygon)
-            cell_density = heatmap[mask].sum()
-            cell_densities.append(cell_density)
-            valid_positions.append(ambulance_positions[i])
+    with instr.span('ambulance.voronoi'):
+        labels = nearest_station_map(heatmap.shape, positions)
+    cell_densities = np.bincount(labels.ravel(), weights=np.asarray(heatmap, dtype=float).ravel(),
+                                 minlength=len(positions))
 
-    if not cell_densities:
-        return np.ones(len(ambulance_positions)), ambulance_positions
+    if cell_densities.max() <= 0:
+        return np.ones(len(positions)), positions
 
-    resources = (np.array(cell_densities) / max(cell_densities)) * 9 + 1
-    return resources, np.array(valid_positions)
+    resources = (cell_densities / cell_densities.max()) * 9 + 1
+    return resources, positions
 
 
 def visualize_placement(heatmap, positions, resources, save_path=None):
+    import matplotlib.pyplot as plt
+    from scipy.spatial import Voronoi, voronoi_plot_2d
+
     plt.figure(figsize=(12, 8))
     plt.imshow(heatmap, cmap='hot', alpha=0.7)
 
     if len(positions) >= 4:
-        vor = Voronoi(positions)
+        vor = Voronoi(positions[:, ::-1])  # (x, y) = (col, row) to match the image axes
         voronoi_plot_2d(vor, ax=plt.gca(), show_points=False, line_colors='white')
 
     plt.scatter(
@@ -136,21 +294,44 @@ def visualize_placement(heatmap, positions, resources, save_path=None):
     plt.close()
 
 
-def process_single_heatmap(heatmap_path, output_dir, num_ambulances=5):
-    heatmap = load_heatmap(heatmap_path)
-    heatmap = gaussian_filter(heatmap, sigma=2)
-
-    regions = extract_cluster_regions(heatmap)
+def process_single_heatmap(heatmap_path, output_dir, num_ambulances=5, name=None,
+                           sigma=2, eps=10, min_samples=20, r_min=30, cluster_method='dbscan'):
+    """
+    Place ambulances for one heatmap
+
+    Args:
+        heatmap_path: Path to a heatmap PNG (legacy) or a 2D array such as
+            a HeatFrameStore frame. Distances (eps, r_min) are in pixels of
+            the heatmap, i.e. grid cells for raw frames.
+        name: Base name of the output image, defaults to the PNG file name;
+            required for an array, since it has no file name of its own
+        cluster_method: 'dbscan' or 'grid', see extract_cluster_regions
+    """
+    if isinstance(heatmap_path, str):
+        heatmap = load_heatmap(heatmap_path)
+        if name is None:
+            name = os.path.splitext(os.path.basename(heatmap_path))[0]
+    else:
+        if name is None:
+            raise ValueError("A name is required for an array heatmap, or its output would be overwritten")
+        heatmap = heatmap_path
+        heatmap_path = name
+    heatmap = gaussian_filter(heatmap, sigma=sigma, output=float)
+
+    with instr.span('ambulance.clusters'):
+        regions = extract_cluster_regions(heatmap, eps=eps, min_samples=min_samples, method=cluster_method)
     if not regions:
         return None
 
-    positions = density_aware_border_placement(heatmap, regions, num_ambulances)
-    resources, valid_positions = allocate_resources(heatmap, positions)
+    with instr.span('ambulance.placement'):
+        positions = density_aware_border_placement(heatmap, regions, num_ambulances, r_min=r_min)
+    with instr.span('ambulance.allocation'):
+        resources, valid_positions = allocate_resources(heatmap, positions)
 
     os.makedirs(output_dir, exist_ok=True)
-    base_name = os.path.splitext(os.path.basename(heatmap_path))[0]
-    output_path = os.path.join(output_dir, f"{base_name}_placement.png")
-    visualize_placement(heatmap, valid_positions, resources, save_path=output_path)
+    output_path = os.path.join(output_dir, f"{name}_placement.png")
+    with instr.span('ambulance.visualize'):
+        visualize_placement(heatmap, valid_positions, resources, save_path=output_path)
 
     return {
         'heatmap': heatmap_path,
@@ -160,25 +341,160 @@ def process_single_heatmap(heatmap_path, output_dir, num_ambulances=5):
     }
 
 
-def process_heatmap_folder(folder_path, output_dir, num_ambulances=5):
+CACHE_DIR = ".placement_cache"
+CACHE_VERSION = 3  # bump when the placement pipeline changes, so old results are recomputed
+
+
+def _folder_jobs(folder_path):
+    """(name, source, frame index) of every heatmap in a HeatFrameStore or PNG folder"""
+    if HeatFrameStore.is_store(folder_path):
+        steps = HeatFrameStore(folder_path).steps()
+        return [(f"heatmap_step_{step:03d}", folder_path, i) for i, step in enumerate(steps)]
+    return [(os.path.splitext(filename)[0], os.path.join(folder_path, filename), None)
+            for filename in sorted(os.listdir(folder_path)) if filename.endswith('.png')]
+
+
+def _load_job(source, index):
+    """Heatmap of a job: the PNG path itself, or the store frame as an array"""
+    return source if index is None else HeatFrameStore(source)[index]
+
+
+def _cache_key(source, index, name, num_ambulances, params):
+    """Hash of the heatmap content and everything that affects its result"""
+    digest = hashlib.blake2b(digest_size=20)
+    if index is None:
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+    else:
+        frame = HeatFrameStore(source)[index]
+        digest.update(str(frame.shape).encode())
+        digest.update(np.ascontiguousarray(frame).tobytes())
+    settings = [CACHE_VERSION, name, num_ambulances, sorted(params.items())]
+    digest.update(json.dumps(settings).encode())
+    return digest.hexdigest()
+
+
+def _read_cache(cache_path):
+    """(hit, result) for a cache entry; entries whose image is gone are misses"""
+    try:
+        with open(cache_path) as f:
+            result = json.load(f)['result']
+    except (OSError, ValueError, KeyError):
+        return False, None
+    if result is not None and not os.path.exists(result['visualization']):
+        return False, None
+    return True, result
+
+
+def _write_cache(cache_path, result):
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'result': result}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def _process_job(source, index, output_dir, num_ambulances, name, params):
+    return process_single_heatmap(_load_job(source, index), output_dir, num_ambulances, name=name, **params)
+
+
+def _iter_jobs(folder_path, output_dir, num_ambulances, workers, cache, params):
+    """Yield (job number, result) as every job finishes, cached ones first"""
+    jobs = _folder_jobs(folder_path)
+    cache_dir = os.path.join(output_dir, CACHE_DIR)
+    if cache:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    pending = []
+    for order, (name, source, index) in enumerate(jobs):
+        cache_path = None
+        if cache:
+            cache_path = os.path.join(cache_dir, _cache_key(source, index, name, num_ambulances, params) + ".json")
+            hit, result = _read_cache(cache_path)
+            if hit:
+                instr.count('ambulance.cache_hits')
+                yield order, result
+                continue
+        pending.append((order, cache_path, (source, index, output_dir, num_ambulances, name, params)))
+
+    def finished(order, cache_path, result):
+        if cache_path is not None:
+            _write_cache(cache_path, result)
+        return order, result
+
+    if workers == 1 or len(pending) <= 1:
+        for order, cache_path, job in pending:
+            yield finished(order, cache_path, _process_job(*job))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_process_job, *job): (order, cache_path) for order, cache_path, job in pending}
+        for future in as_completed(futures):
+            yield finished(*futures[future], future.result())
+
+
+def iter_heatmap_folder(folder_path, output_dir, num_ambulances=5, workers=None, cache=True, **params):
+    """
+    Yield the placement result of every heatmap in folder_path as soon as it is done
+
+    Frames are processed on a pool of worker processes, so results come in
+    completion order, not frame order; result['heatmap'] tells them apart.
+    Frames without clusters yield nothing.
+
+    Args:
+        folder_path: HeatFrameStore directory or folder of PNGs (legacy)
+        workers: Number of worker processes, defaults to the CPU count;
+            1 processes the frames one by one in this process
+        cache: Keep every result in output_dir/.placement_cache, keyed by a
+            hash of the heatmap content, name, num_ambulances and params, and
+            skip frames whose result is already there
+        **params: sigma, eps, min_samples, r_min, cluster_method for
+            process_single_heatmap
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    for _, result in _iter_jobs(folder_path, output_dir, num_ambulances, workers, cache, params):
+        if result:
+            yield result
+
+
+def process_heatmap_folder(folder_path, output_dir, num_ambulances=5, workers=1, cache=True, **params):
+    """
+    Process every frame of a HeatFrameStore, or every PNG in a folder (legacy)
+
+    Returns the results in frame order once all frames are done; see
+    iter_heatmap_folder for the meaning of workers and cache and for
+    streaming results. Extra keyword arguments (sigma, eps, min_samples,
+    r_min, cluster_method) are passed to process_single_heatmap.
+    """
     os.makedirs(output_dir, exist_ok=True)
-    results = []
-    for filename in sorted(os.listdir(folder_path)):
-        if filename.endswith('.png'):
-            heatmap_path = os.path.join(folder_path, filename)
-            result = process_single_heatmap(heatmap_path, output_dir, num_ambulances)
-            if result:
-                results.append(result)
-    return results
+    results = sorted(_iter_jobs(folder_path, output_dir, num_ambulances, workers, cache, params),
+                     key=lambda item: item[0])
+    return [result for _, result in results if result]
 
 
 if __name__ == "__main__":
-    folder_path = "heatmaps"  # Replace with your actual folder path
+    import argparse
+    parser = argparse.ArgumentParser(description="Place ambulances for every heatmap frame")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument('--no-cache', action='store_true', help="recompute frames whose result is cached")
+    parser.add_argument('--cluster-method', choices=CLUSTER_METHODS, default='dbscan',
+                        help="'grid' clusters with image operations, for large heatmaps")
+    args = parser.parse_args()
+
     output_dir = "output_placements"
-    results = process_heatmap_folder(folder_path, output_dir, num_ambulances=30)
+    if HeatFrameStore.is_store("heat_frames"):
+        # Raw frames written by sim.py, one pixel per grid cell
+        results = iter_heatmap_folder("heat_frames", output_dir, num_ambulances=30, workers=args.workers,
+                                      cache=not args.no_cache, cluster_method=args.cluster_method,
+                                      sigma=1.5, eps=2, min_samples=4, r_min=3)
+    else:
+        folder_path = "heatmaps"  # Replace with your actual folder path
+        results = iter_heatmap_folder(folder_path, output_dir, num_ambulances=30, workers=args.workers,
+                                      cache=not args.no_cache, cluster_method=args.cluster_method)
     for result in results:
         print(f"Processed {result['heatmap']}")
         print(f"Ambulance positions: {result['positions']}")
         print(f"Resource allocations: {result['resources']}")
         print(f"Visualization saved to: {result['visualization']}")
-        print("---------------------------")
\ No newline at end of file
+        print("---------------------------")
@@ -0,0 +1,286 @@
+# Benchmarks for the hot paths of the simulation, pathfinding and placement
+# Every benchmark runs on scenarios of grid size x crowd size. For each one
+# the best wall time of a few repeats, the peak traced memory of one run and
+# algorithm counters (nodes expanded, waypoints, clusters...) are recorded.
+# Results are saved as JSON and can be compared against a baseline file,
+# failing with exit code 1 when something got slower than the tolerance.
+#
+# python benchmarks.py --quick --output bench.json
+# python benchmarks.py --quick --baseline bench.json
+#
+# find_path_astar is about 5x faster than the original tuple-based search,
+# not the 10x that was targeted; see PathfindingSystem._astar.
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+
+GRID_SIZES = (50, 200, 1000)
+CROWD_SIZES = (100, 10_000, 100_000)
+QUICK_GRID_SIZES = (50, 200)
+QUICK_CROWD_SIZES = (100, 10_000)
+MAX_CROWD_FRACTION = 0.5  # scenarios with more people than this share of cells are skipped
+
+
+def make_scenario(grid_size, num_people, seed=0, obstacle_ratio=0.02):
+    """Random int8 grid with obstacles and people, plus the (N, 2) people positions"""
+    rng = np.random.default_rng(seed)
+    cells = grid_size * grid_size
+    num_obstacles = int(cells * obstacle_ratio)
+    # Keep the pathfinding corners free by never placing anything on them
+    corners = [2 * grid_size + 2, (grid_size - 3) * grid_size + grid_size - 3]
+    candidates = np.setdiff1d(np.arange(cells), corners)
+    chosen = rng.choice(candidates, num_obstacles + num_people, replace=False)
+    grid = np.zeros(cells, dtype=np.int8)
+    grid[chosen[:num_obstacles]] = -1
+    grid[chosen[num_obstacles:]] = 1
+    grid = grid.reshape(grid_size, grid_size)
+    return grid, np.argwhere(grid == 1)
+
+
+def heat_from_crowd(grid, sigma=2.0):
+    """Smooth heat map standing in for cumulative_heat"""
+    from scipy.ndimage import gaussian_filter
+    return gaussian_filter((grid == 1).astype(float), sigma) * 50
+
+
+# Every benchmark takes (grid, people) and returns (run, counters): run() is
+# the timed call, counters() is called once afterwards and returns a dict.
+# max_grid limits the grid sizes a benchmark is run on.
+
+def bench_step_crowd(grid, people):
+    from step_engine import step_crowd
+    rng = np.random.default_rng(0)
+
+    def counters():
+        _, moved = step_crowd(grid, people, np.random.default_rng(0))
+        return {'people': len(people), 'moved': int((moved != people).any(axis=1).sum())}
+    return lambda: step_crowd(grid, people, rng), counters
+
+
+def bench_get_best_move(grid, people):
+    from step_engine import get_best_move
+    rng = np.random.default_rng(0)
+    sample = [tuple(p) for p in people[:1000]]
+
+    def run():
+        for pos in sample:
+            get_best_move(pos, grid, rng)
+    return run, lambda: {'people': len(sample)}
+
+
+def bench_density_full(grid, people):
+    from pathfinding_system import PathfindingSystem
+    pf = PathfindingSystem(grid.shape[0])
+    return lambda: pf.calculate_density_grid(grid), lambda: {'cells': grid.size}
+
+
+def bench_density_incremental(grid, people):
+    from pathfinding_system import PathfindingSystem
+    from step_engine import step_crowd
+    pf = PathfindingSystem(grid.shape[0])
+    moved, _ = step_crowd(grid, people, np.random.default_rng(0))
+    grids = [grid, moved]
+    state = {'i': 0}
+
+    def run():
+        state['i'] ^= 1
+        pf.calculate_density_grid(grids[state['i']], incremental=True)
+
+    def counters():
+        pf.calculate_density_grid(grid, incremental=True)
+        pf.calculate_density_grid(moved, incremental=True)
+        changed = pf.changed_cells
+        return {'changed_cells': len(changed) if changed is not None else grid.size}
+    return run, counters
+
+
+def _astar_setup(grid):
+    from pathfinding_system import PathfindingSystem
+    pf = PathfindingSystem(grid.shape[0])
+    density = pf.calculate_density_grid(grid)
+    return pf, density, (2, 2), (grid.shape[0] - 3, grid.shape[1] - 3)
+
+
+def bench_find_path_astar(grid, people):
+    pf, density, start, goal = _astar_setup(grid)
+
+    def counters():
+        path, cost, _, expanded = pf._astar(start, goal, grid, density, 1.0, pf.diagonal_cost)
+        return {'nodes_expanded': expanded, 'path_length': len(path), 'cost': cost}
+    return lambda: pf.find_path_astar(start, goal, grid, density, return_explored=False), counters
+
+
+def bench_smooth_path(grid, people):
+    pf, density, start, goal = _astar_setup(grid)
+    path = pf.find_path_astar(start, goal, grid, density)[0]
+
+    def counters():
+        return {'waypoints_in': len(path), 'waypoints_out': len(pf.smooth_path(path, grid, density))}
+    return lambda: pf.smooth_path(path, grid, density), counters
+
+
+def bench_extract_cluster_regions(grid, people):
+    from ambulance import extract_cluster_regions
+    heat = heat_from_crowd(grid)
+
+    def counters():
+        regions = extract_cluster_regions(heat, eps=2, min_samples=4)
+        return {'regions': len(regions), 'points': int(sum(len(r) for r in regions))}
+    return lambda: extract_cluster_regions(heat, eps=2, min_samples=4), counters
+
+
+def bench_grid_cluster_regions(grid, people):
+    from ambulance import extract_cluster_regions
+    heat = heat_from_crowd(grid)
+
+    def counters():
+        regions = extract_cluster_regions(heat, eps=2, min_samples=4, method='grid')
+        return {'regions': len(regions), 'points': int(sum(len(r) for r in regions))}
+    return lambda: extract_cluster_regions(heat, eps=2, min_samples=4, method='grid'), counters
+
+
+def bench_border_placement(grid, people):
+    from ambulance import extract_cluster_regions, density_aware_border_placement
+    heat = heat_from_crowd(grid)
+    regions = extract_cluster_regions(heat, eps=2, min_samples=4)
+
+    def counters():
+        return {'regions': len(regions), 'placed': len(density_aware_border_placement(heat, regions, 30, r_min=3))}
+    return lambda: density_aware_border_placement(heat, regions, 30, r_min=3), counters
+
+
+def bench_allocate_resources(grid, people):
+    from ambulance import extract_cluster_regions, density_aware_border_placement, allocate_resources
+    heat = heat_from_crowd(grid)
+    regions = extract_cluster_regions(heat, eps=2, min_samples=4)
+    positions = density_aware_border_placement(heat, regions, 30, r_min=3)
+
+    def counters():
+        resources, valid = allocate_resources(heat, positions)
+        return {'stations': len(positions), 'allocated': len(valid)}
+    return lambda: allocate_resources(heat, positions), counters
+
+
+# name -> (benchmark, max_grid)
+BENCHMARKS = {
+    'step_crowd': (bench_step_crowd, None),
+    'get_best_move': (bench_get_best_move, None),
+    'calculate_density_grid': (bench_density_full, None),
+    'calculate_density_grid_incremental': (bench_density_incremental, None),
+    'find_path_astar': (bench_find_path_astar, None),
+    'smooth_path': (bench_smooth_path, None),
+    'extract_cluster_regions': (bench_extract_cluster_regions, 200),
+    'extract_cluster_regions_grid': (bench_grid_cluster_regions, None),
+    'density_aware_border_placement': (bench_border_placement, 200),
+    'allocate_resources': (bench_allocate_resources, 200),
+}
+
+
+def result_key(result):
+    return f"{result['name']}[{result['grid_size']}x{result['grid_size']},{result['num_people']}]"
+
+
+def measure(run, repeat):
+    """Best wall time over repeat runs, and the peak traced memory of one more run"""
+    run()  # warm-up: imports, caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def run_benchmarks(grid_sizes, crowd_sizes, names=None, repeat=5):
+    """List of result dicts for every benchmark and scenario that applies"""
+    results = []
+    for grid_size in grid_sizes:
+        for num_people in crowd_sizes:
+            if num_people > MAX_CROWD_FRACTION * grid_size * grid_size:
+                continue
+            grid, people = make_scenario(grid_size, num_people)
+            for name, (bench, max_grid) in BENCHMARKS.items():
+                if names and not any(n in name for n in names):
+                    continue
+                if max_grid is not None and grid_size > max_grid:
+                    continue
+                run, counters = bench(grid, people)
+                seconds, peak = measure(run, repeat)
+                result = {'name': name, 'grid_size': grid_size, 'num_people': num_people,
+                          'seconds': seconds, 'peak_bytes': peak, 'counters': counters()}
+                print(f"{result_key(result):<58} {seconds * 1000:10.2f} ms {peak / 2**20:9.1f} MiB  {result['counters']}")
+                results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=1e-3):
+    """
+    Regressions against a baseline results file
+
+    A result regresses when it is slower than baseline * (1 + tolerance) and
+    the baseline took at least min_seconds (faster ones are mostly noise).
+
+    Returns:
+        List of (key, baseline seconds, new seconds)
+    """
+    old = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in old:
+            continue
+        before, after = old[key]['seconds'], result['seconds']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if before >= min_seconds and after > before * (1 + tolerance):
+            regressions.append((key, before, after))
+            flag = '  REGRESSION'
+        print(f"{key:<58} {before * 1000:10.2f} -> {after * 1000:10.2f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths")
+    parser.add_argument('--quick', action='store_true', help="only the small scenarios")
+    parser.add_argument('--only', nargs='*', help="run benchmarks whose name contains one of these")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against this results JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    grid_sizes = QUICK_GRID_SIZES if args.quick else GRID_SIZES
+    crowd_sizes = QUICK_CROWD_SIZES if args.quick else CROWD_SIZES
+    results = run_benchmarks(grid_sizes, crowd_sizes, args.only, args.repeat)
+
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            raise SystemExit(1)
@@ -0,0 +1,218 @@
+# Importable crowd simulation engine
+# The simulation itself never touches matplotlib. Drawing, saving heatmaps
+# etc. are renderer callbacks that are called after every step, so without
+# renderers the simulation runs headless at full speed. The LSTM helpers are
+# imported on first use, so runs with forecast=False never load TensorFlow.
+#
+# Grid cell meanings
+# 0: empty,
+# -1: obstacle,
+# 1: person
+#
+# Grids are int8 and grid_history only keeps the last few grids (optionally
+# logging older ones to disk), so memory does not grow with the run length.
+
+import numpy as np
+from step_engine import step_crowd
+from grid_history import GridHistory
+import instrumentation as instr
+
+
+class CrowdSimulation:
+    """Crowd simulation driven by step()/run(n), with optional LSTM forecasting"""
+
+    def __init__(self, grid_size=50, num_people=100, obstacle_ratio=0.02,
+                 lstm_start_step=50, sequence_length=10, forecast=True, renderers=None,
+                 forecaster='lstm', background_training=True, history_length=None, history_spill=None,
+                 seed=None):
+        """
+        Args:
+            grid_size: Width and height of the square grid
+            num_people: Number of people in the crowd
+            obstacle_ratio: Fraction of cells filled with obstacles
+            lstm_start_step: Step at which the LSTM is trained and predictions start
+            sequence_length: Number of grids in one LSTM window
+            forecast: Set to False to skip the LSTM entirely
+            renderers: Callables renderer(sim, step) run after every step
+            forecaster: 'lstm' for the dense LSTM, 'conv' for the grid size
+                independent convolutional model (see forecasting.FORECASTERS)
+            background_training: Fit the model on a background thread
+                (online_training.OnlineTrainer) so step() never waits for
+                training. Predictions start once the first fit is published.
+                Ignored for seeded runs: which weights a prediction sees
+                would depend on thread timing.
+            history_length: Grids kept in grid_history, at least the
+                sequence_length the forecaster needs (the default)
+            history_spill: Optional file older grids are logged to
+                (grid_history.read_grid_log reads it back)
+            seed: Seed or np.random.Generator for obstacle and people
+                placement, every move and the forecaster's weights and
+                training (through tf.keras.utils.set_random_seed); the same
+                seed gives the same run
+        """
+        self.grid_size = grid_size
+        self.num_people = num_people
+        self.lstm_start_step = lstm_start_step
+        self.sequence_length = sequence_length
+        self.forecast = forecast
+        self.forecaster = forecaster
+        self.background_training = background_training and seed is None
+        self.renderers = list(renderers) if renderers else []
+
+        self.rng = np.random.default_rng(seed)
+        # Keras seed from the same seed, without drawing from self.rng so the
+        # crowd is the same with and without forecasting
+        self.model_seed = None
+        if seed is not None:
+            seed_seq = seed.bit_generator.seed_seq if isinstance(seed, np.random.Generator) else np.random.SeedSequence(seed)
+            self.model_seed = int(seed_seq.generate_state(1)[0])
+        self.cumulative_heat = np.zeros((grid_size, grid_size), dtype=float)
+
+        grid = np.zeros((grid_size, grid_size), dtype=np.int8)
+
+        # Place obstacles
+        num_obstacles = int(grid_size * grid_size * obstacle_ratio)
+        obstacle_indices = self.rng.choice(grid_size * grid_size, num_obstacles, replace=False)
+        grid.flat[obstacle_indices] = -1
+
+        # Place people
+        people = []
+        while len(people) < num_people:
+            x, y = self.rng.integers(0, grid_size, size=2)
+            if grid[x, y] == 0:
+                grid[x, y] = 1
+                people.append((x, y))
+        self._set_state(grid, np.array(people).reshape(-1, 2))
+
+        # Storage for grid history and accuracy tracking
+        history_length = max(history_length or 0, sequence_length, 2)
+        self.grid_history = GridHistory(history_length, self.grid.shape, history_spill)
+        self.lstm_model = None
+        self.trainer = None
+        self.frames = None  # forecasting.FrameRing of the last sequence_length grids
+        self.accuracy_scores = []
+        self.steps_done = 0
+
+        # Result of the latest step, for renderers
+        self.prediction = None
+        self.accuracy = None
+        self.moves = None  # (N, 2) move of every person, same order as self.people
+
+    def _set_state(self, grid, people):
+        """Start from the given grid and people positions"""
+        self.grid = grid
+        self.people = people
+
+        # Store obstacle positions for later use
+        obstacles = np.where(self.grid == -1)
+        self.obstacle_positions = set(zip(obstacles[0], obstacles[1]))
+        self.obstacle_mask = self.grid == -1
+
+    def step(self):
+        """Advance the crowd by one step, update the forecast and call the renderers"""
+        with instr.span('sim.step'):
+            step = self.steps_done
+            self.grid_history.append(self.grid)
+
+            # Update simulation (whole crowd at once)
+            self.cumulative_heat[self.people[:, 0], self.people[:, 1]] += 1
+            previous = self.people
+            with instr.span('sim.move'):
+                self.grid, self.people = self._move()
+            self.moves = self.people - previous
+
+            self.prediction = None
+            self.accuracy = None
+            if self.forecast and step >= self.lstm_start_step:
+                with instr.span('forecast.update'):
+                    self._update_forecast(step)
+
+            for renderer in self.renderers:
+                with instr.span('render.' + getattr(renderer, '__name__', type(renderer).__name__)):
+                    renderer(self, step)
+
+            self.steps_done += 1
+        return self.grid
+
+    def _move(self):
+        """New grid and people positions for one step"""
+        return step_crowd(self.grid, self.people, self.rng)
+
+    def run(self, num_steps):
+        """Run num_steps steps"""
+        for _ in range(num_steps):
+            self.step()
+        return self.grid
+
+    def close(self):
+        """Stop the background trainer, if any, and finish the history log"""
+        if self.trainer is not None:
+            self.trainer.close()
+            self.trainer = None
+        self.grid_history.close()
+
+    def _update_forecast(self, step):
+        """Train the LSTM at lstm_start_step, then predict and update it every step"""
+        from forecasting import (create_forecaster, model_input, model_target, prepare_lstm_data,
+                                 denormalize_prediction, calculate_accuracy_metrics, FrameRing)
+
+        seq_len = self.sequence_length
+        grid_history = self.grid_history
+
+        if step == self.lstm_start_step:
+            print("Training initial LSTM model...")
+            if self.model_seed is not None:
+                import tensorflow as tf
+                tf.keras.utils.set_random_seed(self.model_seed)
+            self.lstm_model = create_forecaster(self.forecaster, self.grid_size, seq_len)
+            if self.background_training:
+                from online_training import OnlineTrainer
+                self.trainer = OnlineTrainer(self.lstm_model)
+
+            # Train on the last seq_len - 1 grids to predict the next one
+            if len(grid_history) >= seq_len:
+                train_data = prepare_lstm_data(grid_history, len(grid_history) - seq_len, len(grid_history))
+                X_train = model_input(train_data[:-1], self.grid_size, self.forecaster)
+                y_train = model_target(train_data[-1], self.grid_size, self.forecaster)
+
+                self._train(X_train, y_train, epochs=50)
+
+        if len(grid_history) < seq_len or self.lstm_model is None:
+            return
+
+        # Last seq_len grids, each normalized once on arrival
+        if self.frames is None:
+            self.frames = FrameRing(seq_len, self.grid_size * self.grid_size)
+            for g in grid_history[-seq_len:]:
+                self.frames.append(g)
+        else:
+            self.frames.append(grid_history[-1])
+
+        # Predict next grid from the last seq_len - 1 grids, in the background
+        # mode only once trained weights exist
+        if self.trainer is None or self.trainer.version > 0:
+            X_pred = model_input(self.frames.window(seq_len - 1), self.grid_size, self.forecaster)
+            with instr.span('forecast.predict'):
+                if self.trainer is None:
+                    pred_raw = self.lstm_model.predict(X_pred, verbose=0)[0]
+                else:
+                    pred_raw = self.trainer.predict(X_pred)[0]
+            pred_raw = pred_raw.reshape(self.grid_size, self.grid_size)
+            self.prediction = denormalize_prediction(pred_raw, self.obstacle_mask, self.num_people)
+
+            # Calculate accuracy metrics by comparing with actual next step
+            prev_real = grid_history[-2] if len(grid_history) >= 2 else None
+            self.accuracy = calculate_accuracy_metrics(self.grid, self.prediction, self.num_people, prev_real)
+            self.accuracy_scores.append(self.accuracy)
+
+        # Update LSTM model with new data: the window before the newest grid predicts it
+        X_update = model_input(self.frames.window(seq_len - 1, skip_latest=1), self.grid_size, self.forecaster)
+        y_update = model_target(self.frames.window(1)[0], self.grid_size, self.forecaster)
+        self._train(X_update, y_update, epochs=5)
+
+    def _train(self, X, y, epochs):
+        if self.trainer is not None:
+            self.trainer.submit(X, y, epochs)
+        else:
+            with instr.span('forecast.fit'):
+                self.lstm_model.fit(X, y, epochs=epochs, verbose=0)
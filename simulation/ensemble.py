@@ -0,0 +1,138 @@
+# Monte Carlo ensemble of crowd simulations
+# One run gives one cumulative heat map, which depends on the random
+# obstacles, starting positions and move tie-breaks. The ensemble runs N
+# seeded simulations on a process pool. Every run accumulates its heat step
+# by step straight into a slot of one shared-memory block, so nothing but the
+# heat ever crosses process boundaries. The parent folds each finished slot
+# into running sum, sum-of-squares and exceedance counts and hands the slot
+# to the next run, so memory grows with the number of workers, not runs.
+#
+# The maps are plain 2D arrays, e.g.
+# ambulance.process_single_heatmap(result['mean'], "output_placements", name="ensemble_mean")
+
+import argparse
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+
+# Runs the default exceedance threshold is taken from, independent of the worker count
+THRESHOLD_RUNS = 8
+
+
+def _run_member(shm_name, shape, slot, seed, steps, sim_kwargs):
+    """Run one seeded simulation, accumulating its heat into `slot` of the shared block"""
+    from crowd_simulation import CrowdSimulation
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    heat = sim = None
+    try:
+        heat = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[slot]
+        sim = CrowdSimulation(forecast=False, seed=seed, **sim_kwargs)
+        # The simulation adds its per-step heat directly into shared memory
+        heat[:] = sim.cumulative_heat
+        sim.cumulative_heat = heat
+        sim.run(steps)
+        sim.close()
+    finally:
+        # Views into the block must be gone before it can be closed, also when the run failed
+        del heat, sim
+        shm.close()
+    return slot
+
+
+def run_ensemble(num_runs, steps, grid_size=50, num_people=100, obstacle_ratio=0.02,
+                 seed=0, workers=None, threshold=None):
+    """
+    Run num_runs simulations in parallel and aggregate their cumulative heat
+
+    Args:
+        num_runs: Number of simulations; run i is seeded with seed + i
+        steps: Steps per simulation
+        grid_size, num_people, obstacle_ratio: Passed to CrowdSimulation
+        seed: Base seed, so an ensemble is reproducible
+        workers: Number of worker processes, defaults to the CPU count
+        threshold: Heat level for the exceedance map; defaults to the 90th
+            percentile of the heat values of the first THRESHOLD_RUNS runs
+
+    Returns:
+        dict with 'mean', 'variance' and 'exceedance' (probability that a
+        run's heat exceeds threshold) maps of shape (grid_size, grid_size),
+        plus 'threshold' and 'runs'
+    """
+    if num_runs < 1:
+        raise ValueError(f"An ensemble needs at least one run, got num_runs={num_runs}")
+    workers = workers or os.cpu_count()
+    # One slot per worker, and enough for the runs the default threshold comes from
+    num_slots = min(num_runs, max(workers, THRESHOLD_RUNS))
+    shape = (num_slots, grid_size, grid_size)
+    sim_kwargs = {'grid_size': grid_size, 'num_people': num_people, 'obstacle_ratio': obstacle_ratio}
+    heat_sum = np.zeros((grid_size, grid_size))
+    heat_sq_sum = np.zeros((grid_size, grid_size))
+    exceed_count = np.zeros((grid_size, grid_size), dtype=np.int64)
+    runs = iter(range(num_runs))
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        heat = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        heat[:] = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            def submit(slot):
+                i = next(runs, None)
+                if i is None:
+                    return None
+                return pool.submit(_run_member, shm.name, shape, slot, seed + i, steps, sim_kwargs)
+
+            # The first round fills every slot, run i into slot i
+            first_round = [submit(slot) for slot in range(num_slots)]
+            for future in first_round:
+                future.result()
+            if threshold is None:
+                threshold = float(np.percentile(heat[:THRESHOLD_RUNS], 90))
+
+            pending = set()
+            finished = list(range(num_slots))
+            while finished or pending:
+                for slot in finished:
+                    heat_sum += heat[slot]
+                    heat_sq_sum += heat[slot] ** 2
+                    exceed_count += heat[slot] > threshold
+                    future = submit(slot)
+                    if future is not None:
+                        pending.add(future)
+                finished = []
+                if pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    finished = [future.result() for future in done]
+
+        mean = heat_sum / num_runs
+        result = {
+            'mean': mean,
+            'variance': np.maximum(heat_sq_sum / num_runs - mean ** 2, 0),
+            'exceedance': exceed_count / num_runs,
+            'threshold': threshold,
+            'runs': num_runs,
+        }
+        del heat
+    finally:
+        shm.close()
+        shm.unlink()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a Monte Carlo ensemble of crowd simulations")
+    parser.add_argument('--runs', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--output', default="ensemble_heat.npz")
+    args = parser.parse_args()
+
+    result = run_ensemble(args.runs, args.steps, seed=args.seed, workers=args.workers, threshold=args.threshold)
+    np.savez(args.output, mean=result['mean'], variance=result['variance'],
+             exceedance=result['exceedance'], threshold=result['threshold'])
+    print(f"{result['runs']} runs, exceedance threshold {result['threshold']:.1f}")
+    print(f"Peak mean heat {result['mean'].max():.1f}, peak exceedance probability {result['exceedance'].max():.2f}")
+    print(f"Maps saved to {args.output}")
@@ -0,0 +1,170 @@
+# Future crowd prediction with an LSTM or a convolutional forecaster
+# Grids are normalized to 0-1 (obstacles and empty=0.5, people=1), flattened
+# and fed as a sequence of frames to predict the next frame.
+#
+# 'lstm' is the original dense model, its weights grow with the number of
+# grid cells. 'conv' is fully convolutional: the frames of a window are the
+# channels of one image, so the same weights run on any grid size and the
+# cost grows linearly with the number of cells.
+
+import numpy as np
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import LSTM, Dense, Reshape, Conv2D, Input
+from metrics import accuracy_metrics
+
+FORECASTERS = ('lstm', 'conv')
+
+# Normalized value of grid cell v is NORMALIZED[v + 1]. Obstacles come out
+# as 0.5 like empty cells: the original mask sequence set them to 0 and then
+# rewrote every 0 to 0.5, and the trained models have always seen that.
+NORMALIZED = np.array([0.5, 0.5, 1.0], dtype=np.float32)
+
+
+def create_lstm_model(grid_size, sequence_length):
+    model = Sequential([
+        LSTM(128, return_sequences=True, input_shape=(sequence_length, grid_size * grid_size)),
+        LSTM(64, return_sequences=False),
+        Dense(128, activation='relu'),
+        Dense(grid_size * grid_size, activation='sigmoid'),
+        Reshape((grid_size, grid_size))
+    ])
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    return model
+
+def create_conv_model(sequence_length, filters=32):
+    """
+    Fully convolutional forecaster
+
+    Takes the sequence_length - 1 frames of a window as channels of a
+    (rows, cols, sequence_length - 1) image and predicts a (rows, cols, 1)
+    frame. Rows and cols are left open, so one model serves every grid size.
+    """
+    model = Sequential([
+        Input(shape=(None, None, sequence_length - 1)),
+        Conv2D(filters, 3, padding='same', activation='relu'),
+        Conv2D(filters, 3, padding='same', activation='relu'),
+        Conv2D(1, 1, activation='sigmoid')
+    ])
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    return model
+
+def create_forecaster(kind, grid_size, sequence_length):
+    """Model for one of FORECASTERS"""
+    if kind == 'lstm':
+        return create_lstm_model(grid_size, sequence_length)
+    if kind == 'conv':
+        return create_conv_model(sequence_length)
+    raise ValueError(f"Unknown forecaster {kind!r}, expected one of {FORECASTERS}")
+
+def model_input(frames, grid_size, kind):
+    """Batch of one window of flattened frames from prepare_lstm_data, in the layout `kind` expects"""
+    if kind == 'conv':
+        return frames.reshape(len(frames), grid_size, grid_size).transpose(1, 2, 0)[np.newaxis]
+    return frames.reshape(1, len(frames), -1)
+
+def model_target(frame, grid_size, kind):
+    """Training target for one flattened frame"""
+    if kind == 'conv':
+        return frame.reshape(1, grid_size, grid_size, 1)
+    return frame.reshape(1, grid_size, grid_size)
+
+def normalize_grid(grid):
+    """Flattened float32 copy of grid in the 0-1 range the forecasters use"""
+    return NORMALIZED[np.asarray(grid).ravel() + 1]
+
+def prepare_lstm_data(grid_history, start_idx, end_idx):
+    """Prepare sequences for LSTM training"""
+    # Normalize grids to 0-1 range for LSTM
+    return np.array([normalize_grid(g) for g in grid_history[start_idx:end_idx]])
+
+class FrameRing:
+    """
+    Fixed-size ring of normalized, flattened frames
+
+    Each grid is normalized once when it is appended. Every frame is stored
+    twice, at slot i and i + capacity, so the latest n frames are always one
+    contiguous block and windows are zero-copy views.
+    """
+
+    def __init__(self, capacity, num_cells):
+        self.capacity = capacity
+        self._frames = np.zeros((2 * capacity, num_cells), dtype=np.float32)
+        self._next = 0  # slot the next frame goes to
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, grid):
+        frame = normalize_grid(grid)
+        self._frames[self._next] = frame
+        self._frames[self._next + self.capacity] = frame
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def window(self, length, skip_latest=0):
+        """
+        Read-only view of `length` consecutive frames, oldest first
+
+        Args:
+            length: Number of frames in the window
+            skip_latest: Leave out this many of the newest frames, e.g. 1 for
+                the inputs whose target is the newest frame
+        """
+        if length + skip_latest > self._count:
+            raise ValueError(f"Window of {length} + {skip_latest} frames, but only {self._count} are buffered")
+        end = self._next + self.capacity - skip_latest
+        view = self._frames[end - length:end]
+        view.flags.writeable = False
+        return view
+
+def obstacle_mask(obstacles, shape):
+    """Boolean obstacle mask from a mask or an iterable of (x, y) positions"""
+    if isinstance(obstacles, np.ndarray) and obstacles.dtype == bool:
+        return obstacles
+    mask = np.zeros(shape, dtype=bool)
+    positions = np.array(list(obstacles), dtype=int).reshape(-1, 2)
+    mask[positions[:, 0], positions[:, 1]] = True
+    return mask
+
+def denormalize_prediction(pred_grid, obstacles, num_people):
+    """
+    Convert LSTM prediction back to grid format
+
+    The num_people highest scoring non-obstacle cells become people, ties
+    going to the lower flat index, and obstacles are put back as -1.
+
+    Args:
+        pred_grid: (rows, cols) prediction, or (batch, rows, cols) to decode
+            several predictions (e.g. horizons) at once. Not modified.
+        obstacles: Boolean obstacle mask (pass the same array every step),
+            or the set of obstacle positions
+        num_people: Number of people to place
+
+    Returns:
+        int grid(s) of the same shape as pred_grid
+    """
+    pred_grid = np.asarray(pred_grid)
+    mask = obstacle_mask(obstacles, pred_grid.shape[-2:]).ravel()
+    batch = pred_grid.reshape(-1, mask.size)
+
+    # Obstacles can never be picked
+    scores = np.where(mask, -np.inf, batch.astype(float))
+    k = min(num_people, int((~mask).sum()))
+    result = np.zeros(batch.shape, dtype=int)
+    if k > 0:
+        # Value of the k-th best cell of every row, then everything strictly
+        # above it plus the lowest-index cells equal to it
+        kth = np.partition(scores, mask.size - k, axis=1)[:, mask.size - k][:, None]
+        above = scores > kth
+        at_kth = scores == kth
+        needed = k - above.sum(axis=1, keepdims=True)
+        chosen = above | (at_kth & (np.cumsum(at_kth, axis=1) <= needed))
+        result[chosen] = 1
+    result[:, mask] = -1
+
+    return result.reshape(pred_grid.shape)
+
+def calculate_accuracy_metrics(real_grid, pred_grid, num_people, prev_real=None):
+    """Calculate comprehensive accuracy metrics (see metrics.accuracy_metrics)"""
+    return accuracy_metrics(real_grid, pred_grid, num_people, prev_real)
@@ -0,0 +1,98 @@
+# Binary store for cumulative heat frames
+# The simulation appends raw float32 frames to one file and ambulance.py reads
+# them back through a memory map, so there is no PNG encode/decode and no
+# 8-bit quantization between the two.
+#
+# Layout of a store directory:
+# index.json  - frame shape and dtype, written once
+# frames.f32  - frames back to back, C order
+# steps.i64   - simulation step of every frame
+
+import json
+import os
+import numpy as np
+
+INDEX_FILE = "index.json"
+FRAMES_FILE = "frames.f32"
+STEPS_FILE = "steps.i64"
+
+
+class HeatFrameStore:
+    """Append-only store of float32 heat frames backed by a memory-mapped file"""
+
+    def __init__(self, path, shape=None, overwrite=False):
+        """
+        Open the store at path, creating it if shape is given and it doesn't exist yet
+
+        Args:
+            path: Store directory
+            shape: (rows, cols) of every frame, needed only to create a new store
+            overwrite: Start an empty store even if one already exists at path
+        """
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path) and not (overwrite and shape is not None):
+            with open(index_path) as f:
+                index = json.load(f)
+            self.shape = tuple(index['shape'])
+            if shape is not None and tuple(shape) != self.shape:
+                raise ValueError(f"Store at {path} holds {self.shape} frames, not {tuple(shape)}")
+        elif shape is not None:
+            os.makedirs(path, exist_ok=True)
+            self.shape = tuple(int(s) for s in shape)
+            with open(index_path, 'w') as f:
+                json.dump({'shape': list(self.shape), 'dtype': 'float32'}, f)
+            open(os.path.join(path, FRAMES_FILE), 'wb').close()
+            open(os.path.join(path, STEPS_FILE), 'wb').close()
+        else:
+            raise ValueError(f"No heat frame store at {path}")
+
+        self.frame_bytes = int(np.prod(self.shape)) * 4
+        self._frames = None
+
+    @staticmethod
+    def is_store(path):
+        return os.path.exists(os.path.join(path, INDEX_FILE))
+
+    def __len__(self):
+        return os.path.getsize(os.path.join(self.path, FRAMES_FILE)) // self.frame_bytes
+
+    def append(self, frame, step):
+        """Append one frame, recorded under simulation step `step`"""
+        frame = np.ascontiguousarray(frame, dtype=np.float32)
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match store shape {self.shape}")
+        with open(os.path.join(self.path, FRAMES_FILE), 'ab') as f:
+            f.write(frame.tobytes())
+        with open(os.path.join(self.path, STEPS_FILE), 'ab') as f:
+            f.write(np.int64(step).tobytes())
+
+    def frames(self):
+        """Read-only (count, rows, cols) memory map over all frames written so far"""
+        count = len(self)
+        if self._frames is None or len(self._frames) != count:
+            if count == 0:
+                return np.empty((0,) + self.shape, dtype=np.float32)
+            self._frames = np.memmap(os.path.join(self.path, FRAMES_FILE), dtype=np.float32,
+                                     mode='r', shape=(count,) + self.shape)
+        return self._frames
+
+    def steps(self):
+        return np.fromfile(os.path.join(self.path, STEPS_FILE), dtype=np.int64)[:len(self)]
+
+    def __getitem__(self, i):
+        """Frame i as a zero-copy view into the memory map"""
+        return self.frames()[i]
+
+
+class HeatFrameWriter:
+    """CrowdSimulation renderer that writes cumulative_heat to a fresh HeatFrameStore every step"""
+
+    def __init__(self, path):
+        self.path = path
+        self.store = None
+
+    def __call__(self, sim, step):
+        if self.store is None:
+            self.store = HeatFrameStore(self.path, sim.cumulative_heat.shape, overwrite=True)
+        self.store.append(sim.cumulative_heat, step)
@@ -0,0 +1,101 @@
+# Bounded history of simulation grids
+# Grids only hold -1/0/1, so frames are kept as int8 in a fixed-size ring
+# sized to what forecasting needs. Frames that fall out of the ring can be
+# appended to a compressed log on disk, so memory stays flat however long a
+# run is.
+#
+# Log layout: header b'GRIDLOG1' + int32 rows + int32 cols, then per frame a
+# uint32 byte count and zlib(packbits(people) + packbits(obstacles)).
+
+import struct
+import zlib
+import numpy as np
+
+LOG_MAGIC = b'GRIDLOG1'
+
+
+class GridHistory:
+    """
+    The last `capacity` grids of a run, indexed like a list of every grid
+
+    len() counts every grid ever appended and indices are over that whole
+    run (negative ones from the end), but only the newest `capacity` grids
+    can be read back; older ones raise IndexError. Grids are returned as
+    copies, since later appends overwrite the ring slots.
+    """
+
+    def __init__(self, capacity, shape, spill_path=None):
+        """
+        Args:
+            capacity: Number of grids kept in memory
+            shape: (rows, cols) of every grid
+            spill_path: Optional file that evicted grids are appended to,
+                read it back with read_grid_log
+        """
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self._frames = np.zeros((capacity,) + self.shape, dtype=np.int8)
+        self._count = 0
+        self._log = None
+        if spill_path is not None:
+            self._log = open(spill_path, 'wb')
+            self._log.write(LOG_MAGIC + struct.pack('<ii', *self.shape))
+
+    def __len__(self):
+        return self._count
+
+    def append(self, grid):
+        slot = self._count % self.capacity
+        if self._log is not None and self._count >= self.capacity:
+            self._spill(self._frames[slot])
+        self._frames[slot] = grid
+        self._count += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f"Grid {index} out of range for a history of {self._count}")
+        if index < self._count - self.capacity:
+            raise IndexError(f"Grid {index} is no longer in memory (only the last {self.capacity} are kept)")
+        return self._frames[index % self.capacity].copy()
+
+    def nbytes(self):
+        return self._frames.nbytes
+
+    def close(self):
+        """Spill the grids still in memory and close the log"""
+        if self._log is None:
+            return
+        for i in range(max(0, self._count - self.capacity), self._count):
+            self._spill(self._frames[i % self.capacity])
+        self._log.close()
+        self._log = None
+
+    def _spill(self, grid):
+        planes = np.packbits(grid == 1).tobytes() + np.packbits(grid == -1).tobytes()
+        record = zlib.compress(planes)
+        self._log.write(struct.pack('<I', len(record)) + record)
+
+
+def read_grid_log(path):
+    """Yield the int8 grids of a GridHistory spill log in order"""
+    with open(path, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"{path} is not a grid log")
+        shape = struct.unpack('<ii', f.read(8))
+        cells = shape[0] * shape[1]
+        plane_bytes = (cells + 7) // 8
+        while True:
+            header = f.read(4)
+            if not header:
+                return
+            planes = np.frombuffer(zlib.decompress(f.read(struct.unpack('<I', header)[0])), dtype=np.uint8)
+            people = np.unpackbits(planes[:plane_bytes])[:cells].astype(bool)
+            obstacles = np.unpackbits(planes[plane_bytes:])[:cells].astype(bool)
+            grid = np.zeros(cells, dtype=np.int8)
+            grid[people] = 1
+            grid[obstacles] = -1
+            yield grid.reshape(shape)
@@ -0,0 +1,280 @@
+# Hierarchical pathfinding (HPA*) for venue-scale grids
+# The grid is cut into square chunks. Cells where two chunks touch become
+# entrance nodes, and the cheapest in-chunk cost between every two entrances
+# of a chunk is precomputed from the density grid. A query searches this
+# small abstract graph and then runs A* only inside the chunks on the route.
+
+import heapq
+import math
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from pathfinding_system import grid_graph
+
+
+class HierarchicalPathfinder:
+    """
+    HPA* on top of a PathfindingSystem
+
+    Costs are the ones find_path_astar uses. Paths are optimal inside each
+    chunk but only cross chunk borders at entrance nodes, so they can cost a
+    little more than a flat A* path.
+    """
+
+    def __init__(self, pathfinder, grid, density_grid, cluster_size=32, max_entrance_width=6):
+        """
+        Args:
+            pathfinder: PathfindingSystem whose step costs and A* are used
+            grid: 2D grid with obstacles (-1), empty (0), people (1)
+            density_grid: Density grid for the intra-chunk costs
+            cluster_size: Width and height of a chunk in cells
+            max_entrance_width: Border openings wider than this get an
+                entrance at both ends instead of one in the middle
+        """
+        self.pathfinder = pathfinder
+        self.grid = grid
+        self.density_grid = density_grid
+        self.cluster_size = cluster_size
+        self.max_entrance_width = max_entrance_width
+        rows, cols = grid.shape
+        self.num_chunks = (-(-rows // cluster_size), -(-cols // cluster_size))
+
+        self.nodes = []  # abstract node id -> (x, y)
+        self.node_ids = {}  # (x, y) -> abstract node id
+        self.chunk_nodes = {}  # chunk -> list of node ids
+        self.transitions = []  # (a, b) node ids of neighbouring cells in two chunks
+        self._find_entrances()
+
+        self.inter_edges = {}  # (a, b) -> cost of stepping from a to b
+        self.intra_edges = {}  # chunk -> {(a, b): cost}
+        self.rebuilt_chunks = 0
+        self._adjacency_cache = None
+        for a, b in self.transitions:
+            self._set_inter_cost(a, b)
+        for chunk in self.chunk_nodes:
+            self._build_chunk(chunk)
+
+    def chunk_of(self, pos):
+        return (int(pos[0]) // self.cluster_size, int(pos[1]) // self.cluster_size)
+
+    def _chunk_bounds(self, chunk):
+        rows, cols = self.grid.shape
+        c = self.cluster_size
+        return (chunk[0] * c, min((chunk[0] + 1) * c, rows),
+                chunk[1] * c, min((chunk[1] + 1) * c, cols))
+
+    def _node(self, pos):
+        if pos not in self.node_ids:
+            self.node_ids[pos] = len(self.nodes)
+            self.nodes.append(pos)
+            self.chunk_nodes.setdefault(self.chunk_of(pos), []).append(self.node_ids[pos])
+        return self.node_ids[pos]
+
+    def _find_entrances(self):
+        """Entrance nodes on every border between two neighbouring chunks"""
+        rows, cols = self.grid.shape
+        passable = self.grid != -1
+        c = self.cluster_size
+        for chunk in np.ndindex(*self.num_chunks):
+            self.chunk_nodes.setdefault(chunk, [])
+
+        # Vertical borders between (i, j) and (i, j + 1), then horizontal ones
+        for y in range(c - 1, cols - 1, c):
+            self._border_entrances(passable[:, y] & passable[:, y + 1],
+                                   lambda x, y=y: ((x, y), (x, y + 1)), c)
+        for x in range(c - 1, rows - 1, c):
+            self._border_entrances(passable[x, :] & passable[x + 1, :],
+                                   lambda y, x=x: ((x, y), (x + 1, y)), c)
+
+    def _border_entrances(self, open_cells, cell_pair, c):
+        """Turn each run of open border cells, split at chunk corners, into transitions"""
+        size = len(open_cells)
+        for lo in range(0, size, c):
+            run_start = None
+            for i in range(lo, min(lo + c, size) + 1):
+                is_open = i < min(lo + c, size) and open_cells[i]
+                if is_open and run_start is None:
+                    run_start = i
+                elif not is_open and run_start is not None:
+                    run_end = i - 1
+                    if run_end - run_start + 1 > self.max_entrance_width:
+                        picks = (run_start, run_end)
+                    else:
+                        picks = ((run_start + run_end) // 2,)
+                    for p in picks:
+                        a, b = cell_pair(p)
+                        self.transitions.append((self._node(a), self._node(b)))
+                    run_start = None
+
+    def _set_inter_cost(self, a, b):
+        """Border crossings are straight steps both ways"""
+        density = self.density_grid
+        self.inter_edges[(a, b)] = float(density[self.nodes[b]])
+        self.inter_edges[(b, a)] = float(density[self.nodes[a]])
+
+    def _local_graph(self, chunk):
+        x0, x1, y0, y1 = self._chunk_bounds(chunk)
+        pf = self.pathfinder
+        graph = grid_graph(self.grid[x0:x1, y0:y1], self.density_grid[x0:x1, y0:y1],
+                           pf.directions, pf.diagonal_cost)
+        return graph, (x0, y0), y1 - y0
+
+    def _build_chunk(self, chunk):
+        """Cheapest in-chunk cost between every two entrances of the chunk"""
+        ids = self.chunk_nodes[chunk]
+        edges = {}
+        if len(ids) > 1:
+            graph, (x0, y0), width = self._local_graph(chunk)
+            local = [(self.nodes[i][0] - x0) * width + self.nodes[i][1] - y0 for i in ids]
+            dist = dijkstra(graph, directed=True, indices=local)
+            for r, a in enumerate(ids):
+                for col, b in enumerate(ids):
+                    if a != b and np.isfinite(dist[r, local[col]]):
+                        edges[(a, b)] = float(dist[r, local[col]])
+        self.intra_edges[chunk] = edges
+        self.rebuilt_chunks += 1
+
+    def update(self, density_grid, changed_cells=None):
+        """
+        Rebuild the abstract edges of the chunks whose density changed
+
+        Obstacles must be unchanged; build a new HierarchicalPathfinder
+        when they move.
+
+        Args:
+            density_grid: The new density grid
+            changed_cells: (x, y) cells whose density changed, e.g.
+                PathfindingSystem.changed_cells. None diffs the whole grid.
+
+        Returns:
+            The set of rebuilt chunks
+        """
+        if changed_cells is None:
+            changed_cells = np.argwhere(self.density_grid != density_grid)
+        changed_cells = np.asarray(changed_cells, dtype=int).reshape(-1, 2)
+        self.density_grid = density_grid
+
+        dirty = {(int(x), int(y)) for x, y in np.unique(changed_cells // self.cluster_size, axis=0)}
+        for a, b in self.transitions:
+            if self.chunk_of(self.nodes[a]) in dirty or self.chunk_of(self.nodes[b]) in dirty:
+                self._set_inter_cost(a, b)
+        for chunk in dirty:
+            self._build_chunk(chunk)
+        self._adjacency_cache = None
+        return dirty
+
+    def _endpoint_edges(self, pos, reverse=False):
+        """Costs from pos to every entrance of its chunk (or from them to pos)"""
+        chunk = self.chunk_of(pos)
+        graph, (x0, y0), width = self._local_graph(chunk)
+        if reverse:
+            graph = graph.T.tocsr()
+        dist = dijkstra(graph, directed=True, indices=(pos[0] - x0) * width + pos[1] - y0)
+        costs = {}
+        for i in self.chunk_nodes[chunk]:
+            x, y = self.nodes[i]
+            d = dist[(x - x0) * width + y - y0]
+            if np.isfinite(d):
+                costs[i] = float(d)
+        return costs, dist, (x0, y0), width
+
+    def find_path(self, start, goal):
+        """
+        Search the abstract graph, then refine the chunks on the route
+
+        Returns:
+            path: List of (x, y) coordinates from start to goal
+            cost: Total path cost
+        """
+        pf = self.pathfinder
+        if not pf.is_valid_position(start, self.grid):
+            print(f"Invalid start position: {start}")
+            return [], float('inf')
+        if not pf.is_valid_position(goal, self.grid):
+            print(f"Invalid goal position: {goal}")
+            return [], float('inf')
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+
+        start_costs, start_dist, (x0, y0), width = self._endpoint_edges(start)
+        goal_costs, _, _, _ = self._endpoint_edges(goal, reverse=True)
+
+        # Abstract search: START and GOAL are temporary nodes
+        START, GOAL = -1, -2
+        adjacency = self._adjacency()
+        best_direct = math.inf
+        if self.chunk_of(start) == self.chunk_of(goal):
+            best_direct = float(start_dist[(goal[0] - x0) * width + goal[1] - y0])
+
+        def h(node):
+            x, y = goal if node == GOAL else (start if node == START else self.nodes[node])
+            return math.sqrt((x - goal[0])**2 + (y - goal[1])**2)
+
+        g_score = {START: 0.0}
+        came_from = {}
+        open_set = [(h(START), START)]
+        closed = set()
+        while open_set:
+            _, node = heapq.heappop(open_set)
+            if node in closed:
+                continue
+            closed.add(node)
+            if node == GOAL:
+                break
+            if node == START:
+                moves = list(start_costs.items())
+                if np.isfinite(best_direct):
+                    moves.append((GOAL, best_direct))
+            else:
+                moves = list(adjacency.get(node, ()))
+                if node in goal_costs:
+                    moves.append((GOAL, goal_costs[node]))
+            for neighbour, cost in moves:
+                tentative = g_score[node] + cost
+                if tentative < g_score.get(neighbour, math.inf):
+                    g_score[neighbour] = tentative
+                    came_from[neighbour] = node
+                    heapq.heappush(open_set, (tentative + h(neighbour), neighbour))
+
+        if GOAL not in g_score:
+            return [], float('inf')
+
+        route = [GOAL]
+        while route[-1] != START:
+            route.append(came_from[route[-1]])
+        route.reverse()
+        waypoints = [start] + [self.nodes[n] for n in route[1:-1]] + [goal]
+        return self._refine(waypoints)
+
+    def _adjacency(self):
+        if self._adjacency_cache is not None:
+            return self._adjacency_cache
+        adjacency = {}
+        for (a, b), cost in self.inter_edges.items():
+            adjacency.setdefault(a, []).append((b, cost))
+        for edges in self.intra_edges.values():
+            for (a, b), cost in edges.items():
+                adjacency.setdefault(a, []).append((b, cost))
+        self._adjacency_cache = adjacency
+        return adjacency
+
+    def _refine(self, waypoints):
+        """Concrete path: A* inside the chunk for in-chunk hops, a single step across borders"""
+        pf = self.pathfinder
+        path = [waypoints[0]]
+        cost = 0.0
+        for a, b in zip(waypoints, waypoints[1:]):
+            if a == b:
+                continue
+            if self.chunk_of(a) != self.chunk_of(b):
+                path.append(b)
+                cost += pf.get_movement_cost(a, b, self.density_grid)
+                continue
+            x0, x1, y0, y1 = self._chunk_bounds(self.chunk_of(a))
+            segment, segment_cost, _, _ = pf._astar((a[0] - x0, a[1] - y0), (b[0] - x0, b[1] - y0),
+                                                    self.grid[x0:x1, y0:y1], self.density_grid[x0:x1, y0:y1],
+                                                    1.0, pf.diagonal_cost)
+            if not segment:
+                return [], float('inf')
+            path.extend((x + x0, y + y0) for x, y in segment[1:])
+            cost += segment_cost
+        return path, cost
@@ -0,0 +1,57 @@
+# Startup budget for the modules short-lived workers import
+# Every module is imported in a fresh interpreter, timed, and checked for
+# heavy packages that should only load on first use. Exits non-zero when a
+# module is over budget or pulls in a forbidden package, so it can gate CI.
+#
+# python import_budget.py [--repeat 5] [--budget 0.6]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# module -> packages it must not import at load time
+CHECKS = {
+    'pathfinding_system': ('matplotlib', 'tensorflow', 'scipy.sparse'),
+    'ambulance': ('matplotlib', 'tensorflow', 'cv2', 'sklearn', 'shapely', 'scipy.spatial'),
+    'crowd_simulation': ('matplotlib', 'tensorflow'),
+    'sim': ('matplotlib', 'tensorflow'),
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, forbidden, repeat=5):
+    """Best-of-repeat import time of module in a fresh interpreter, and the forbidden packages it loaded"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    times, loaded = [], set()
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, forbidden=tuple(forbidden))],
+                             cwd=here, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        loaded.update(result['loaded'])
+    return min(times), sorted(loaded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check cold import time of the simulation modules")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=0.6, help="seconds allowed per module")
+    args = parser.parse_args()
+
+    failed = False
+    for module, forbidden in CHECKS.items():
+        seconds, loaded = measure(module, forbidden, args.repeat)
+        ok = seconds <= args.budget and not loaded
+        failed |= not ok
+        extra = f" loaded {', '.join(loaded)}" if loaded else ""
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<20} {seconds * 1000:7.1f} ms{extra}")
+    sys.exit(1 if failed else 0)
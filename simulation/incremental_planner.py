@@ -0,0 +1,288 @@
+# Incremental replanning (D* Lite) for routes through a moving crowd
+# Between two simulation steps only a few density cells change, so instead of
+# running A* from scratch every tick the planner keeps its search tree and
+# only repairs the part of it that the changed cells affect.
+
+import heapq
+import math
+import numpy as np
+
+# Keys of the same node computed along different routes can differ by float
+# rounding, so queue entries within this of the start's key are expanded too
+KEY_TOLERANCE = 1e-9
+
+
+class IncrementalPlanner:
+    """
+    D* Lite planner over a density grid
+
+    Costs are the same as PathfindingSystem.find_path_astar: moving into cell
+    v costs (1 or diagonal_cost) * density[v], and cells with density -1 are
+    obstacles. The search runs backwards from the goal, so the start can
+    move along the route between updates.
+    """
+
+    def __init__(self, pathfinder, start, goal, density_grid):
+        self.pathfinder = pathfinder
+        rows, cols = density_grid.shape
+        self.shape = (rows, cols)
+        self.width = cols + 2
+        width = self.width
+        offsets, step_costs = pathfinder._neighbour_offsets(width, 1.0, pathfinder.diagonal_cost)
+        self.neighbours = list(zip(offsets, step_costs))
+
+        # Padded density, the border is an obstacle ring
+        self.density = np.pad(np.asarray(density_grid, dtype=float), 1, constant_values=-1).ravel().tolist()
+        size = (rows + 2) * width
+        self.g = [math.inf] * size
+        self.rhs = [math.inf] * size
+        self.open_keys = {}  # node -> key it is queued under
+        self.open_set = []  # heap of (k1, k2, node), stale entries are skipped
+
+        self.start = self._index(start)
+        self.goal = self._index(goal)
+        self.last_start = self.start
+        self._h_from_start()
+        self.km = 0.0
+        self.rhs[self.goal] = 0.0
+        self._queue(self.goal, self._key(self.goal))
+
+        self.last_expanded = 0
+        self.total_expanded = 0
+        self.path, self.cost = self._compute()
+
+    def _index(self, pos):
+        return (int(pos[0]) + 1) * self.width + int(pos[1]) + 1
+
+    def _h(self, a, b):
+        ax, ay = divmod(a, self.width)
+        bx, by = divmod(b, self.width)
+        return math.sqrt((ax - bx)**2 + (ay - by)**2)
+
+    def _h_from_start(self):
+        """Table of the heuristic from the current start to every cell"""
+        rows, cols = self.shape
+        sx, sy = divmod(self.start, self.width)
+        xs = np.arange(rows + 2)[:, None] - sx
+        ys = np.arange(cols + 2)[None, :] - sy
+        self.h = np.sqrt(xs * xs + ys * ys).ravel().tolist()
+
+    def _key(self, node):
+        g_rhs = min(self.g[node], self.rhs[node])
+        return (g_rhs + self.h[node] + self.km, g_rhs)
+
+    def _queue(self, node, key):
+        self.open_keys[node] = key
+        heapq.heappush(self.open_set, (key[0], key[1], node))
+
+    def _top(self):
+        """Smallest valid queue entry as (key, node), or (None, None)"""
+        open_set = self.open_set
+        while open_set:
+            k1, k2, node = open_set[0]
+            if self.open_keys.get(node) == (k1, k2):
+                return (k1, k2), node
+            heapq.heappop(open_set)
+        return None, None
+
+    def _update_rhs(self, node):
+        """rhs = cheapest move to a neighbour plus that neighbour's g"""
+        if node == self.goal:
+            return
+        density, g = self.density, self.g
+        if density[node] == -1:
+            self.rhs[node] = math.inf
+            return
+        best = math.inf
+        for offset, step_cost in self.neighbours:
+            neighbour = node + offset
+            if density[neighbour] == -1:
+                continue
+            value = step_cost * density[neighbour] + g[neighbour]
+            if value < best:
+                best = value
+        self.rhs[node] = best
+
+    def _update_vertex(self, node):
+        if self.g[node] != self.rhs[node]:
+            self._queue(node, self._key(node))
+        elif node in self.open_keys:
+            del self.open_keys[node]
+
+    def _compute(self):
+        """Expand nodes until the start is consistent, then read off the path"""
+        expanded = 0
+        g, rhs, density = self.g, self.rhs, self.density
+        start = self.start
+        while True:
+            top_key, node = self._top()
+            if top_key is None:
+                break
+            # Continue while the start is inconsistent or could still be
+            # improved by a node whose key is not clearly above its own
+            start_key = self._key(start)
+            if not (top_key[0] < start_key[0] + KEY_TOLERANCE or rhs[start] != g[start]):
+                break
+
+            new_key = self._key(node)
+            if top_key < new_key:
+                self._queue(node, new_key)
+                continue
+
+            del self.open_keys[node]
+            heapq.heappop(self.open_set)
+            expanded += 1
+            if g[node] > rhs[node]:
+                g[node] = rhs[node]
+                # Predecessors of node may now reach the goal more cheaply through it
+                for offset, step_cost in self.neighbours:
+                    pred = node + offset
+                    if density[pred] == -1 or pred == self.goal:
+                        continue
+                    value = step_cost * density[node] + g[node]
+                    if value < rhs[pred]:
+                        rhs[pred] = value
+                        self._update_vertex(pred)
+            else:
+                g[node] = math.inf
+                self._update_rhs(node)
+                self._update_vertex(node)
+                for offset, _ in self.neighbours:
+                    pred = node + offset
+                    if density[pred] == -1:
+                        continue
+                    self._update_rhs(pred)
+                    self._update_vertex(pred)
+
+        self.last_expanded = expanded
+        self.total_expanded += expanded
+        return self._extract_path()
+
+    def _extract_path(self):
+        """
+        Follow the cheapest neighbour + g from the start to the goal
+
+        A walk that revisits a cell or does not reach the goal means the g
+        values are not consistent; it is reported as no path rather than
+        returned with a finite cost.
+        """
+        g, density = self.g, self.density
+        current = self.start
+        if self.rhs[current] == math.inf:
+            return [], float('inf')
+
+        width = self.width
+        path = [divmod(current, width)]
+        visited = {current}
+        cost = 0.0
+        while current != self.goal:
+            best = None
+            for offset, step_cost in self.neighbours:
+                neighbour = current + offset
+                if density[neighbour] == -1:
+                    continue
+                move = step_cost * density[neighbour]
+                total = move + g[neighbour]
+                if best is None or total < best[0]:
+                    best = (total, move, neighbour)
+            if best is None or best[0] == math.inf or best[2] in visited:
+                return [], float('inf')
+            cost += best[1]
+            current = best[2]
+            visited.add(current)
+            path.append(divmod(current, width))
+        return [(x - 1, y - 1) for x, y in path], cost
+
+    def update(self, density_grid, changed_cells=None, start=None):
+        """
+        Repair the plan after a density update
+
+        Args:
+            density_grid: The new density grid
+            changed_cells: (x, y) cells whose density changed, e.g.
+                PathfindingSystem.changed_cells after an incremental update.
+                None compares the whole grid with the planner's copy.
+            start: New start position if the traveller moved along the route
+
+        Returns:
+            path, cost of the repaired plan; self.last_expanded holds the
+            number of nodes re-expanded for it
+        """
+        rows, cols = self.shape
+        if changed_cells is None:
+            old = np.array(self.density).reshape(rows + 2, cols + 2)[1:-1, 1:-1]
+            changed_cells = np.argwhere(old != density_grid)
+        changed_cells = np.asarray(changed_cells, dtype=int).reshape(-1, 2)
+
+        if start is not None:
+            new_start = self._index(start)
+            if new_start != self.start:
+                self.km += self._h(self.last_start, new_start)
+                self.last_start = new_start
+                self.start = new_start
+                self._h_from_start()
+
+        # Moving into a changed cell costs something else now, so the cell
+        # and every neighbour that can step into it need a new rhs
+        affected = set()
+        for x, y in changed_cells:
+            node = self._index((x, y))
+            self.density[node] = float(density_grid[x, y])
+            affected.add(node)
+            for offset, _ in self.neighbours:
+                affected.add(node + offset)
+        for node in affected:
+            if self.density[node] == -1:
+                self.g[node] = math.inf
+                self.rhs[node] = math.inf
+                self.open_keys.pop(node, None)
+                continue
+            self._update_rhs(node)
+            self._update_vertex(node)
+
+        self.path, self.cost = self._compute()
+        return self.path, self.cost
+
+    def full_replan_expansions(self, grid):
+        """Nodes a from-scratch A* search expands on the planner's current densities"""
+        rows, cols = self.shape
+        density_grid = np.array(self.density).reshape(rows + 2, cols + 2)[1:-1, 1:-1]
+        start = tuple(int(v) - 1 for v in divmod(self.start, self.width))
+        goal = tuple(int(v) - 1 for v in divmod(self.goal, self.width))
+        return self.pathfinder._astar(start, goal, grid, density_grid, 1.0, self.pathfinder.diagonal_cost)[3]
+
+
+class RouteTracker:
+    """
+    CrowdSimulation renderer that keeps a route updated every step
+
+    Uses an incremental density update and an IncrementalPlanner, and records
+    how many nodes each repair re-expanded.
+    """
+
+    def __init__(self, start, goal, compare_full_replan=False):
+        self.start = start
+        self.goal = goal
+        self.compare_full_replan = compare_full_replan
+        self.pathfinder = None
+        self.planner = None
+        self.stats = []
+
+    def __call__(self, sim, step):
+        from pathfinding_system import PathfindingSystem
+
+        if self.planner is None:
+            self.pathfinder = PathfindingSystem(sim.grid_size)
+            density_grid = self.pathfinder.calculate_density_grid(sim.grid)
+            self.planner = self.pathfinder.incremental_planner(self.start, self.goal, sim.grid, density_grid)
+        else:
+            self.pathfinder.replan(self.planner, sim.grid)
+
+        stats = {'step': step, 'cost': self.planner.cost, 'reexpanded': self.planner.last_expanded}
+        if self.compare_full_replan:
+            stats['full_replan_expanded'] = self.planner.full_replan_expansions(sim.grid)
+        self.stats.append(stats)
+
+    @property
+    def path(self):
+        return self.planner.path if self.planner else []
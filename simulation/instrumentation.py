@@ -0,0 +1,188 @@
+# Lightweight instrumentation: named spans, counters and histograms
+# Everything is off by default. While disabled, span() hands back one shared
+# no-op context manager and count()/observe() return right away, so the
+# calls can stay in hot code. enable() starts recording; the results can be
+# written as a Chrome trace event file (chrome://tracing, Perfetto or
+# speedscope show it as a flame graph) or pushed as a JSON snapshot to the
+# backend's /metrics/ endpoint.
+#
+# Memory stays bounded in long runs: only the latest MAX_EVENTS spans are
+# kept for the trace, and histograms keep exact count/sum/min/max plus a
+# fixed-size random sample of their values for the percentiles.
+
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+
+MAX_EVENTS = 100_000
+HISTOGRAM_SAMPLES = 1024
+
+_enabled = False
+_lock = threading.Lock()
+_events = deque(maxlen=MAX_EVENTS)  # (name, start_ns, duration_ns, thread id)
+_counters = {}
+_histograms = {}  # name -> _Histogram
+_origin_ns = time.perf_counter_ns()
+_sample_rng = random.Random(0)
+
+
+class _Histogram:
+    """Running count/sum/min/max and a reservoir sample of the observed values"""
+    __slots__ = ('count', 'sum', 'min', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < HISTOGRAM_SAMPLES:
+            self.samples.append(value)
+        else:
+            i = _sample_rng.randrange(self.count)
+            if i < HISTOGRAM_SAMPLES:
+                self.samples[i] = value
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        n = len(ordered)
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': ordered[n // 2],
+            'p95': ordered[min(n - 1, int(n * 0.95))],
+        }
+
+
+def _observe(name, value):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = _Histogram()
+    histogram.add(value)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        with _lock:
+            _events.append((self.name, self.start, duration, threading.get_ident()))
+            _observe(self.name + '.ms', duration / 1e6)
+        return False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop everything recorded so far"""
+    global _origin_ns
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _histograms.clear()
+        _origin_ns = time.perf_counter_ns()
+
+
+def span(name):
+    """Context manager timing the block as span `name` (also a `name.ms` histogram)"""
+    return _Span(name) if _enabled else _NO_SPAN
+
+
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """Add one value to histogram `name`"""
+    if not _enabled:
+        return
+    with _lock:
+        _observe(name, float(value))
+
+
+def snapshot():
+    """Counters and histogram summaries recorded so far, as a JSON-ready dict"""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'histograms': {name: histogram.summary() for name, histogram in _histograms.items()},
+        }
+
+
+def write_trace(path):
+    """Write the recorded spans (the latest MAX_EVENTS) in Chrome trace event format"""
+    pid = os.getpid()
+    with _lock:
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - _origin_ns) / 1000, 'dur': duration / 1000}
+                  for name, start, duration, tid in _events]
+        counters = dict(_counters)
+    # Final counter values as counter events at the end of the trace
+    end = max((e['ts'] + e['dur'] for e in events), default=0)
+    events += [{'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end, 'args': {name: value}}
+               for name, value in counters.items()]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def push_metrics(url, source="simulation", timeout=5, token=None):
+    """
+    POST snapshot() to the backend metrics endpoint, e.g. http://127.0.0.1:8000/metrics/
+
+    token is the backend's METRICS_TOKEN, read from the METRICS_TOKEN
+    environment variable when not given.
+    """
+    body = json.dumps({'source': source, 'metrics': snapshot()}).encode()
+    headers = {'Content-Type': 'application/json'}
+    token = token or os.environ.get('METRICS_TOKEN')
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(url, data=body, headers=headers)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
@@ -0,0 +1,104 @@
+# Accuracy metrics for crowd forecasts, on whole arrays
+# Every metric works on one (rows, cols) grid or on a stack of T grids, so a
+# full evaluation run is scored in one call. Grids use the simulation's cell
+# values: -1 obstacle, 0 empty, 1 person.
+
+import numpy as np
+
+METRICS = ('overall', 'position', 'clustering', 'direction')
+
+
+def neighbour_counts(people):
+    """People in the 3x3 block around every interior cell, including the cell itself"""
+    rows, cols = people.shape[-2:]
+    counts = np.zeros(people.shape[:-2] + (rows - 2, cols - 2), dtype=int)
+    for dx in range(3):
+        for dy in range(3):
+            counts += people[..., dx:rows - 2 + dx, dy:cols - 2 + dy]
+    return counts
+
+
+def people_centres(people):
+    """Mean (x, y) of the people of every grid, (0, 0) for grids without people"""
+    rows, cols = people.shape[-2:]
+    count = people.sum(axis=(-2, -1))
+    safe = np.maximum(count, 1)
+    cx = (people * np.arange(rows)[:, None]).sum(axis=(-2, -1)) / safe
+    cy = (people * np.arange(cols)[None, :]).sum(axis=(-2, -1)) / safe
+    return np.where(count > 0, cx, 0.0), np.where(count > 0, cy, 0.0)
+
+
+def overall_accuracy(real, pred):
+    """Percentage of cells predicted exactly"""
+    return (real == pred).mean(axis=(-2, -1)) * 100
+
+
+def position_accuracy(real, pred, num_people):
+    """Percentage of num_people whose cell is also a person in the prediction"""
+    real_people = real == 1
+    correct = (real_people & (pred == 1)).sum(axis=(-2, -1))
+    return np.where(real_people.any(axis=(-2, -1)), correct / num_people * 100, 0.0)
+
+
+def clustering_accuracy(real, pred):
+    """
+    How well the prediction keeps every person's neighbourhood
+
+    For each real person on an interior cell the number of real neighbours
+    is compared with the number of predicted people around it (not counting
+    the cell itself); the similarity is 1 - |difference| / 8.
+    """
+    real_people = (real == 1)
+    pred_people = (pred == 1)
+    centre = real_people[..., 1:-1, 1:-1]
+    real_n = neighbour_counts(real_people) - 1
+    pred_n = neighbour_counts(pred_people) - pred_people[..., 1:-1, 1:-1]
+
+    # Max possible neighbours is 8; people with no neighbours in either grid add 0 but still count
+    similarity = 1 - np.abs(real_n - pred_n) / np.maximum(8, np.maximum(real_n, pred_n))
+    scored = centre & ((real_n > 0) | (pred_n > 0))
+    total = np.where(scored, similarity, 0.0).sum(axis=(-2, -1))
+    people = centre.sum(axis=(-2, -1))
+    return np.where(people > 0, total / np.maximum(people, 1) * 100, 0.0)
+
+
+def direction_accuracy(real, pred, prev_real):
+    """How closely the predicted crowd centre moved like the real one since prev_real"""
+    real_x, real_y = people_centres(real == 1)
+    pred_x, pred_y = people_centres(pred == 1)
+    prev_x, prev_y = people_centres(prev_real == 1)
+
+    real_dx, real_dy = real_x - prev_x, real_y - prev_y
+    pred_dx, pred_dy = pred_x - prev_x, pred_y - prev_y
+    moved = np.abs(real_dx) + np.abs(real_dy)
+    similarity = 1 - (np.abs(real_dx - pred_dx) + np.abs(real_dy - pred_dy)) / (moved + 1e-6)
+    # Only scored if there was significant movement
+    return np.where(moved > 0.1, np.maximum(0, similarity * 100), 0.0)
+
+
+def accuracy_metrics(real, pred, num_people, prev_real=None):
+    """
+    All four metrics for one grid or a stack of grids
+
+    Args:
+        real: (rows, cols) or (T, rows, cols) real grids
+        pred: Predicted grids of the same shape
+        num_people: Number of people in the crowd
+        prev_real: Optional real grids the direction is measured from, same
+            shape; without it direction accuracy is 0
+
+    Returns:
+        dict of METRICS -> percentage, a float for one grid or a (T,) array
+    """
+    real = np.asarray(real)
+    pred = np.asarray(pred)
+    results = {
+        'overall': overall_accuracy(real, pred),
+        'position': position_accuracy(real, pred, num_people),
+        'clustering': clustering_accuracy(real, pred),
+        'direction': (direction_accuracy(real, pred, np.asarray(prev_real)) if prev_real is not None
+                      else np.zeros(real.shape[:-2])),
+    }
+    if real.ndim == 2:
+        return {name: float(value) for name, value in results.items()}
+    return results
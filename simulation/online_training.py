@@ -0,0 +1,108 @@
+# Background online training for the forecasters
+# Training runs on its own thread and model. Every finished fit is copied
+# into the back one of two inference models, which is then swapped to the
+# front, so predict() always sees a complete set of weights and never waits
+# for a fit to finish.
+
+import queue
+import threading
+import numpy as np
+import instrumentation as instr
+from tensorflow.keras.models import clone_model
+
+
+class OnlineTrainer:
+    """
+    Trains a compiled Keras model on a background thread
+
+    (X, y) windows are queued with submit(). When more than max_pending are
+    waiting the oldest is dropped, since newer windows matter more for an
+    online model than a full backlog.
+    """
+
+    def __init__(self, model, max_pending=4):
+        """
+        Args:
+            model: Compiled model, used only by the training thread from now on
+            max_pending: Number of queued windows kept before dropping the oldest
+        """
+        self.model = model
+        self.version = 0  # Number of weight sets published so far
+        self.dropped = 0
+        self.error = None
+
+        # Double buffer of inference models; each lock is held while its model
+        # predicts or receives weights
+        self._buffers = [self._clone(model), self._clone(model)]
+        self._locks = [threading.Lock(), threading.Lock()]
+        self._front = 0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='online-trainer', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _clone(model):
+        clone = clone_model(model)
+        clone.set_weights(model.get_weights())
+        return clone
+
+    def submit(self, X, y, epochs=5):
+        """
+        Queue one training batch without waiting for it
+
+        X and y are copied, so they may be views into buffers the caller
+        overwrites later.
+        """
+        if self.error is not None:
+            raise RuntimeError("Online training failed") from self.error
+        X, y = np.array(X), np.array(y)
+        while True:
+            try:
+                self._queue.put_nowait((X, y, epochs))
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def predict(self, X):
+        """Predict with the latest published weights"""
+        front = self._front
+        with self._locks[front]:
+            return self._buffers[front].predict(X, verbose=0)
+
+    def wait(self):
+        """Block until every queued batch has been trained on and published"""
+        self._queue.join()
+
+    def close(self):
+        """Finish the queued batches and stop the training thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                X, y, epochs = item
+                with instr.span('forecast.fit'):
+                    self.model.fit(X, y, epochs=epochs, verbose=0)
+                self._publish(self.model.get_weights())
+            except Exception as e:
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def _publish(self, weights):
+        back = 1 - self._front
+        with self._locks[back]:
+            self._buffers[back].set_weights(weights)
+        # Swapping the index is a single assignment, readers see either buffer whole
+        self._front = back
+        self.version += 1
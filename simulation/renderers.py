@@ -0,0 +1,150 @@
+# Matplotlib renderers for CrowdSimulation
+# Every renderer is a callable renderer(sim, step) that is run after each
+# simulation step. Figures are only created when a renderer is constructed.
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+from scipy.ndimage import gaussian_filter
+
+GRID_CMAP = ListedColormap(['white', 'blue', 'black'])  # empty, people, obstacles
+
+
+class GridRenderer:
+    """Live view of the crowd, shown while there is no LSTM prediction"""
+
+    def __init__(self, pause=0.2):
+        self.pause = pause
+        self.fig = plt.figure(figsize=(7, 7))
+        self.ax = self.fig.add_subplot(1, 1, 1)
+
+    def __call__(self, sim, step):
+        if sim.prediction is not None:
+            return
+        # clear previous images
+        self.ax.clear()
+
+        display = np.copy(sim.grid)
+        display[display == -1] = 2
+        self.ax.imshow(display, cmap=GRID_CMAP)
+        self.ax.set_title(f"Mela Crowd Movement - Step {step}")
+        self.ax.axis('off')
+        plt.pause(self.pause)
+
+
+class HeatmapRenderer:
+    """Live blurred view of the cumulative heat"""
+
+    def __init__(self, sigma=1.5, pause=0.2):
+        self.sigma = sigma
+        self.pause = pause
+        self.fig = plt.figure(figsize=(7, 7))
+
+    def __call__(self, sim, step):
+        self.fig.clf()  # Clear entire figure
+        ax = self.fig.add_subplot(1, 1, 1)  # Recreate axis
+        blurred = gaussian_filter(sim.cumulative_heat, sigma=self.sigma)
+
+        im = ax.imshow(blurred, cmap='hot', interpolation='bilinear')  # 'hot' = red-orange
+        ax.set_title(f"Blurry Heatmap - Step {step}")
+        ax.axis('off')
+
+        # Add new colorbar
+        self.fig.colorbar(im, ax=ax)
+        plt.pause(self.pause)
+
+
+class ComparisonRenderer:
+    """Real simulation and LSTM prediction side by side with accuracy metrics"""
+
+    def __init__(self, pause=0.2):
+        self.pause = pause
+        self.fig, (self.ax_real, self.ax_pred) = plt.subplots(1, 2, figsize=(14, 6))
+        self.accuracy_text_obj = None
+
+    def __call__(self, sim, step):
+        if sim.prediction is None:
+            return
+        real_grid, pred_grid, accuracy_metrics = sim.grid, sim.prediction, sim.accuracy
+
+        # Clear previous images
+        self.ax_real.clear()
+        self.ax_pred.clear()
+
+        # Real simulation
+        display_real = np.copy(real_grid)
+        display_real[display_real == -1] = 2
+        self.ax_real.imshow(display_real, cmap=GRID_CMAP)
+        self.ax_real.set_title(f"Real Simulation - Step {step}")
+        self.ax_real.axis('off')
+
+        # LSTM prediction
+        display_pred = np.copy(pred_grid)
+        display_pred[display_pred == -1] = 2
+        self.ax_pred.imshow(display_pred, cmap=GRID_CMAP)
+        self.ax_pred.set_title(f"LSTM Prediction - Step {step + 1}")
+        self.ax_pred.axis('off')
+
+        # Add accuracy information as text below the plots
+        self.fig.suptitle(f"Crowd Movement Prediction Comparison", fontsize=16, fontweight='bold')
+
+        # Adjust layout first
+        self.fig.subplots_adjust(bottom=0.15)  # Make room for the accuracy text
+
+        # Remove old accuracy text if exists
+        if self.accuracy_text_obj is not None:
+            self.accuracy_text_obj.remove()
+
+        # Create accuracy text
+        accuracy_text = (f"Accuracy Metrics:\n"
+                        f"Overall: {accuracy_metrics['overall']:.1f}% | "
+                        f"Position: {accuracy_metrics['position']:.1f}% | "
+                        f"Clustering: {accuracy_metrics['clustering']:.1f}% | "
+                        f"Direction: {accuracy_metrics['direction']:.1f}%")
+
+        # Add text below the subplots
+        self.accuracy_text_obj = self.fig.text(0.5, 0.02, accuracy_text, ha='center', fontsize=12,
+            bbox=dict(boxstyle="round,pad=0.3", facecolor="lightgray", alpha=0.7))
+
+        plt.pause(self.pause)
+
+
+class HeatmapSaver:
+    """Save the blurred cumulative heat as a PNG per step"""
+
+    def __init__(self, output_dir="heatmaps", sigma=1.5):
+        self.output_dir = output_dir
+        self.sigma = sigma
+
+    def __call__(self, sim, step):
+        save_heatmap(sim.cumulative_heat, step, self.output_dir, self.sigma)
+
+
+def save_heatmap(heat_data, step, output_dir="heatmaps", sigma=1.5):
+    os.makedirs(output_dir, exist_ok=True)  # Create the directory if it doesn't exist
+
+    plt.figure(figsize=(7, 7))
+    blurred = gaussian_filter(heat_data, sigma=sigma)
+    plt.imshow(blurred, cmap='hot', interpolation='bilinear')
+
+    # Remove axes and border
+    plt.axis('off')
+    plt.gca().set_position([0, 0, 1, 1])  # Expand image to full figure without margins
+
+    # Save as PNG without padding or extra borders
+    filepath = os.path.join(output_dir, f"heatmap_step_{step:03d}.png")
+    plt.savefig(filepath, bbox_inches='tight', pad_inches=0)
+    plt.close()
+
+
+def default_renderers(pause=0.2, png_dir=None):
+    """The interactive views sim.py shows, plus legacy heatmap PNGs if png_dir is given"""
+    renderers = [
+        GridRenderer(pause),
+        ComparisonRenderer(pause),
+        HeatmapRenderer(pause=pause),
+    ]
+    if png_dir:
+        renderers.append(HeatmapSaver(png_dir))
+    return renderers
@@ -0,0 +1,97 @@
+# Record and replay of simulation runs
+# MoveRecorder is a renderer that logs the crowd at the first step it sees
+# and then one byte per person per step: which of the five moves they made.
+# ReplaySimulation is a CrowdSimulation that reads its moves back from such
+# a log instead of computing them, so forecasters and pathfinders can be
+# compared on identical crowd trajectories, and replaying is much faster
+# than simulating.
+#
+# Layout of a replay directory:
+# start.npz - grid, people and step number before the first recorded step
+# moves.u8  - one move code per person per step, MOVES[code] is the (dx, dy)
+
+import os
+import numpy as np
+from crowd_simulation import CrowdSimulation
+
+START_FILE = "start.npz"
+MOVES_FILE = "moves.u8"
+
+MOVES = np.array([(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)])  # stay, up, down, left, right
+# Code of move (dx, dy) is MOVE_CODES[(dx + 1) * 3 + dy + 1]; diagonal moves never happen
+MOVE_CODES = np.full(9, 255, dtype=np.uint8)
+MOVE_CODES[(MOVES[:, 0] + 1) * 3 + MOVES[:, 1] + 1] = np.arange(len(MOVES))
+
+
+class MoveRecorder:
+    """CrowdSimulation renderer that writes a replay log of the run to path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = False
+
+    def __call__(self, sim, step):
+        if not self.started:
+            os.makedirs(self.path, exist_ok=True)
+            np.savez(os.path.join(self.path, START_FILE), grid=sim.grid_history[-1],
+                     people=sim.people - sim.moves, step=step)
+            open(os.path.join(self.path, MOVES_FILE), 'wb').close()
+            self.started = True
+
+        codes = MOVE_CODES[(sim.moves[:, 0] + 1) * 3 + sim.moves[:, 1] + 1]
+        with open(os.path.join(self.path, MOVES_FILE), 'ab') as f:
+            f.write(codes.tobytes())
+
+
+class ReplayLog:
+    """Start state and move codes of a recorded run"""
+
+    def __init__(self, path):
+        with np.load(os.path.join(path, START_FILE)) as start:
+            self.grid = start['grid']
+            self.people = start['people']
+            self.first_step = int(start['step'])
+        num_people = len(self.people)
+        size = os.path.getsize(os.path.join(path, MOVES_FILE))
+        self.num_steps = size // num_people if num_people else 0
+        self.moves = np.memmap(os.path.join(path, MOVES_FILE), dtype=np.uint8, mode='r',
+                               shape=(self.num_steps, num_people)) if self.num_steps else np.empty((0, num_people), np.uint8)
+
+
+class ReplaySimulation(CrowdSimulation):
+    """
+    CrowdSimulation whose crowd follows a recorded run
+
+    Forecasting, renderers and heat accumulation work as in a live run; only
+    the moves come from the log. Keyword arguments are passed on to
+    CrowdSimulation (grid size and crowd come from the log). The forecaster
+    always trains synchronously, so replays of one log give the same
+    forecasts; pass seed to also fix its initial weights.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.log = ReplayLog(path)
+        kwargs['background_training'] = False
+        super().__init__(grid_size=self.log.grid.shape[0], num_people=0, obstacle_ratio=0, **kwargs)
+        self.num_people = len(self.log.people)
+        self._set_state(self.log.grid.copy(), self.log.people.astype(np.intp))
+        self.steps_done = self.log.first_step
+
+    @property
+    def steps_left(self):
+        return self.log.num_steps - (self.steps_done - self.log.first_step)
+
+    def step(self):
+        # Checked before the step touches any state, so the simulation is
+        # left at the end of the log rather than half-stepped
+        if self.steps_left <= 0:
+            raise IndexError(f"Replay log ends after {self.log.num_steps} steps")
+        return super().step()
+
+    def _move(self):
+        index = self.steps_done - self.log.first_step
+        people = self.people + MOVES[self.log.moves[index]]
+        grid = self.grid.copy()
+        grid[self.people[:, 0], self.people[:, 1]] = 0
+        grid[people[:, 0], people[:, 1]] = 1
+        return grid, people
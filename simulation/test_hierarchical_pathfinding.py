@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from hierarchical_pathfinding import HierarchicalPathfinder
+from pathfinding_system import PathfindingSystem
+from test_pathfinding_system import random_grid
+
+
+def assert_valid_path(pf, path, cost, start, goal, grid, density_grid):
+    """Connected 8-neighbour steps over free cells whose movement costs add up to cost"""
+    assert path[0] == start and path[-1] == goal
+    assert all(grid[cell] != -1 for cell in path)
+    steps = np.diff(np.asarray(path), axis=0)
+    assert np.all(np.abs(steps).max(axis=1) == 1)
+    total = sum(pf.get_movement_cost(a, b, density_grid) for a, b in zip(path, path[1:]))
+    assert cost == pytest.approx(total)
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('size, cluster_size', [(64, 16), (100, 32)])
+def test_find_path_is_valid_and_no_cheaper_than_astar(seed, size, cluster_size):
+    grid = random_grid(size, seed, obstacle_fraction=0.1)
+    start, goal = (1, 1), (size - 2, size - 3)
+    grid[start] = grid[goal] = 0
+    pf = PathfindingSystem(size)
+    density = pf.calculate_density_grid(grid)
+
+    path, cost = HierarchicalPathfinder(pf, grid, density, cluster_size=cluster_size).find_path(start, goal)
+    _, astar_cost, _ = pf.find_path_astar(start, goal, grid, density, return_explored=False)
+
+    assert np.isfinite(astar_cost)
+    assert_valid_path(pf, path, cost, start, goal, grid, density)
+    assert cost >= astar_cost - 1e-9
+
+
+def test_update_matches_a_fresh_build():
+    size = 64
+    rng = np.random.default_rng(0)
+    grid = random_grid(size, 0, obstacle_fraction=0.1)
+    start, goal = (1, 1), (size - 2, size - 3)
+    grid[start] = grid[goal] = 0
+    pf = PathfindingSystem(size)
+    hpa = HierarchicalPathfinder(pf, grid, pf.calculate_density_grid(grid), cluster_size=16)
+
+    # Move a few people, keeping the obstacles
+    people = np.argwhere(grid == 1)
+    free = np.argwhere(grid == 0)
+    grid = grid.copy()
+    grid[tuple(people[rng.choice(len(people), 20, replace=False)].T)] = 0
+    grid[tuple(free[rng.choice(len(free), 20, replace=False)].T)] = 1
+    grid[start] = grid[goal] = 0
+    density = pf.calculate_density_grid(grid, incremental=True)
+    hpa.update(density, pf.changed_cells)
+
+    path, cost = hpa.find_path(start, goal)
+    fresh_path, fresh_cost = HierarchicalPathfinder(pf, grid, density, cluster_size=16).find_path(start, goal)
+    assert_valid_path(pf, path, cost, start, goal, grid, density)
+    assert cost == pytest.approx(fresh_cost)
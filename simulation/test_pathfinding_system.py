@@ -0,0 +1,297 @@
+import heapq
+import math
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from pathfinding_system import PathfindingSystem, STRATEGIES, raster_segments
+
+
+def reference_astar(pf, start, goal, grid, density_grid, diagonal_cost):
+    """The original tuple-based A*, kept as the reference for the flat-array search"""
+    if not pf.is_valid_position(start, grid) or not pf.is_valid_position(goal, grid):
+        return [], float('inf'), set()
+
+    open_set = [(0, start)]
+    came_from = {}
+    g_score = defaultdict(lambda: float('inf'))
+    g_score[start] = 0
+    explored = set()
+
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        if current in explored:
+            continue
+        explored.add(current)
+
+        if current == goal:
+            path = []
+            while current in came_from:
+                path.append(current)
+                current = came_from[current]
+            path.append(start)
+            path.reverse()
+            return path, g_score[goal], explored
+
+        for dx, dy in pf.directions:
+            neighbor = (current[0] + dx, current[1] + dy)
+            if not pf.is_valid_position(neighbor, grid) or neighbor in explored:
+                continue
+            base_cost = diagonal_cost if (dx != 0 and dy != 0) else 1.0
+            tentative_g = g_score[current] + base_cost * density_grid[neighbor]
+            if tentative_g < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g
+                heapq.heappush(open_set, (tentative_g + pf.heuristic(neighbor, goal), neighbor))
+
+    return [], float('inf'), explored
+
+
+def random_grid(size, seed, obstacle_fraction=0.2, people_fraction=0.1):
+    rng = np.random.default_rng(seed)
+    cells = rng.random((size, size))
+    grid = np.zeros((size, size), dtype=int)
+    grid[cells < obstacle_fraction] = -1
+    grid[(cells >= obstacle_fraction) & (cells < obstacle_fraction + people_fraction)] = 1
+    return grid
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('profile', STRATEGIES, ids=lambda p: p.name)
+def test_find_path_astar_matches_reference(seed, profile):
+    size = 40
+    grid = random_grid(size, seed)
+    start, goal = (0, 0), (size - 1, size - 1)
+    grid[start] = grid[goal] = 0
+    pf = PathfindingSystem(size)
+    density = pf.calculate_density_grid(grid)
+
+    path, cost, explored = pf.find_path_astar(start, goal, grid, density, profile=profile)
+
+    transformed = density if profile.density_transform is None else profile.density_transform(density)
+    ref_path, ref_cost, ref_explored = reference_astar(pf, start, goal, grid, transformed, profile.diagonal_cost)
+    assert path == ref_path
+    assert cost == ref_cost or (math.isinf(cost) and math.isinf(ref_cost))
+    assert explored == ref_explored
+
+
+def test_find_path_astar_explored_opt_out():
+    grid = random_grid(20, 0)
+    grid[0, 0] = grid[19, 19] = 0
+    pf = PathfindingSystem(20)
+    path, cost, explored = pf.find_path_astar((0, 0), (19, 19), grid, return_explored=False)
+    assert explored is None
+    assert (path, cost) == pf.find_path_astar((0, 0), (19, 19), grid)[:2]
+
+
+def test_find_path_field_follows_grid_changes():
+    pf = PathfindingSystem(30)
+    empty = np.zeros((30, 30), dtype=int)
+    walled = empty.copy()
+    walled[:25, 15] = -1
+
+    for grid in (empty, walled, empty):
+        path, cost = pf.find_path_field((0, 0), (29, 29), grid)
+        expected = pf.find_path_astar((0, 0), (29, 29), grid, return_explored=False)[1]
+        assert cost == pytest.approx(expected)
+        assert path[-1] == (29, 29)
+        assert all(grid[cell] != -1 for cell in path)
+
+
+def test_find_path_field_stops_on_stale_field():
+    pf = PathfindingSystem(30)
+    empty = np.zeros((30, 30), dtype=int)
+    walled = empty.copy()
+    walled[:26, 15] = -1
+    walled[25, 5:16] = -1
+    # In this pocket a field that does not match the grid only leads uphill;
+    # the walk must give up instead of looping forever
+    field = pf.cost_to_go_field((29, 29), empty)
+    pf.cost_to_go_field = lambda goal, grid, density_grid=None: field
+    assert pf.find_path_field((0, 0), (29, 29), walled, pf.calculate_density_grid(walled)) == ([], float('inf'))
+
+
+def test_find_multiple_paths_leaves_instance_state_alone():
+    pf = PathfindingSystem(30)
+    grid = random_grid(30, 1)
+    grid[0, 0] = grid[29, 29] = 0
+    other = random_grid(30, 2)
+    before = pf.calculate_density_grid(other)
+    version = pf.density_version
+
+    paths = pf.find_multiple_paths((0, 0), (29, 29), grid)
+
+    assert pf.density_grid is before and pf.density_version == version
+    assert np.array_equal(pf.density_grid_for(grid), PathfindingSystem(30).calculate_density_grid(grid))
+    expected = pf.find_path_astar((0, 0), (29, 29), grid, pf.density_grid_for(grid))
+    assert paths[0]['path'] == expected[0] and paths[0]['cost'] == expected[1]
+
+
+def reference_density(grid, influence_radius=3):
+    """The original per-cell density loop"""
+    density_grid = np.ones(grid.shape, dtype=float)
+    people_coords = list(zip(*np.where(grid == 1)))
+    for x in range(grid.shape[0]):
+        for y in range(grid.shape[1]):
+            if grid[x, y] == -1:
+                density_grid[x, y] = -1
+                continue
+            density_value = 1.0
+            for px, py in people_coords:
+                distance = math.sqrt((x - px)**2 + (y - py)**2)
+                if distance <= influence_radius:
+                    density_value += max(0, (influence_radius - distance) / influence_radius) * 3
+            density_grid[x, y] = min(density_value, 12)
+    return density_grid
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('influence_radius', [3, 2.5])
+def test_calculate_density_grid_matches_reference(seed, influence_radius):
+    grid = random_grid(25, seed, people_fraction=0.2)
+    density = PathfindingSystem(25).calculate_density_grid(grid, influence_radius)
+    np.testing.assert_allclose(density, reference_density(grid, influence_radius), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_density_equals_full_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    grid = random_grid(40, seed)
+    incremental = PathfindingSystem(40)
+    incremental.calculate_density_grid(grid, incremental=True)
+
+    for moves in (1, 3, 10, 100):
+        # Move some people to free cells, keeping the obstacles
+        people = np.argwhere(grid == 1)
+        free = np.argwhere(grid == 0)
+        leaving = people[rng.choice(len(people), moves, replace=False)]
+        arriving = free[rng.choice(len(free), moves, replace=False)]
+        previous = incremental.density_grid
+        grid = grid.copy()
+        grid[leaving[:, 0], leaving[:, 1]] = 0
+        grid[arriving[:, 0], arriving[:, 1]] = 1
+
+        density = incremental.calculate_density_grid(grid, incremental=True)
+        full = PathfindingSystem(40).calculate_density_grid(grid)
+        assert np.array_equal(density, full)
+        changed = np.argwhere(previous != full)
+        assert {tuple(c) for c in incremental.changed_cells} == {tuple(c) for c in changed}
+
+
+def bresenham_cells(start, end):
+    """Cells of the original step-by-step Bresenham walk in has_clear_line_of_sight"""
+    x0, y0 = start
+    x1, y1 = end
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    x_inc = 1 if x1 > x0 else -1
+    y_inc = 1 if y1 > y0 else -1
+    error = dx - dy
+    x, y = x0, y0
+    cells = [(x, y)]
+    while (x, y) != (x1, y1):
+        e2 = 2 * error
+        if e2 > -dy:
+            error -= dy
+            x += x_inc
+        if e2 < dx:
+            error += dx
+            y += y_inc
+        cells.append((x, y))
+    return cells
+
+
+def test_raster_segments_matches_bresenham():
+    rng = np.random.default_rng(0)
+    starts = rng.integers(-30, 30, size=(5000, 2))
+    ends = rng.integers(-30, 30, size=(5000, 2))
+    xs, ys, valid, steps = raster_segments(starts, ends)
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        cells = list(zip(xs[i][valid[i]].tolist(), ys[i][valid[i]].tolist()))
+        assert cells == bresenham_cells(start, end)
+        assert steps[i] == len(cells) - 1
+
+
+def test_lines_of_sight_matches_bresenham():
+    grid = random_grid(30, 3, obstacle_fraction=0.15)
+    pf = PathfindingSystem(30)
+    rng = np.random.default_rng(1)
+    start = (15, 15)
+    grid[start] = 0
+    ends = rng.integers(-2, 32, size=(500, 2))
+    expected = [all(pf.is_valid_position(cell, grid) for cell in bresenham_cells(start, tuple(end)))
+                for end in ends.tolist()]
+    assert pf.lines_of_sight(start, ends, grid).tolist() == expected
+
+
+def assert_segments_clear(pf, path, grid):
+    """Every straight segment of a waypoint path is obstacle free"""
+    for a, b in zip(path, path[1:]):
+        assert all(grid[cell] != -1 for cell in bresenham_cells(a, b))
+        assert pf.has_clear_line_of_sight(a, b, grid)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_theta_and_smoothed_paths_are_obstacle_free(seed):
+    size = 40
+    grid = random_grid(size, seed)
+    start, goal = (0, 0), (size - 1, size - 1)
+    grid[start] = grid[goal] = 0
+    pf = PathfindingSystem(size)
+    density = pf.calculate_density_grid(grid)
+    path, cost, _ = pf.find_path_astar(start, goal, grid, density, return_explored=False)
+    if not path:
+        pytest.skip("no path on this grid")
+
+    theta_path, theta_cost = pf.find_path_theta(start, goal, grid, density)
+    assert theta_path[0] == start and theta_path[-1] == goal
+    assert_segments_clear(pf, theta_path, grid)
+    assert theta_cost == pytest.approx(pf.path_cost(theta_path, density))
+    assert theta_cost <= cost + 1e-9
+
+    for density_grid in (None, density):
+        smoothed = pf.smooth_path(path, grid, density_grid)
+        assert smoothed[0] == start and smoothed[-1] == goal
+        assert set(smoothed) <= set(path)
+        assert_segments_clear(pf, smoothed, grid)
+    assert pf.path_cost(pf.smooth_path(path, grid, density), density) <= cost + 1e-9
+
+
+def test_cost_to_go_field_cache_with_calculated_density():
+    pf = PathfindingSystem(30)
+    grid = random_grid(30, 4)
+    grid[0, 0] = grid[29, 29] = 0
+    density = pf.calculate_density_grid(grid)
+
+    field = pf.cost_to_go_field((29, 29), grid, density)
+    assert pf.cost_to_go_field((29, 29), grid, density) is field
+    assert pf.cost_to_go_field((29, 29), grid) is field
+    # A density grid the instance did not calculate is never cached
+    other = density.copy()
+    assert pf.cost_to_go_field((29, 29), grid, other) is not field
+    np.testing.assert_array_equal(pf.cost_to_go_field((29, 29), grid, other), field)
+
+    path, cost = pf.find_path_field((0, 0), (29, 29), grid, density)
+    assert cost == pytest.approx(pf.find_path_astar((0, 0), (29, 29), grid, density)[1])
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 5])
+def test_replan_matches_astar_every_step(seed):
+    from crowd_simulation import CrowdSimulation
+
+    sim = CrowdSimulation(50, 100, 0.02, forecast=False, seed=seed)
+    pf = PathfindingSystem(50)
+    start, goal = (2, 2), (47, 30)
+    planner = pf.incremental_planner(start, goal, sim.grid)
+
+    for _ in range(40):
+        sim.step()
+        path, cost = pf.replan(planner, sim.grid)
+        _, expected, _ = pf.find_path_astar(start, goal, sim.grid, pf.density_grid, return_explored=False)
+        if math.isinf(expected):
+            assert path == [] and math.isinf(cost)
+            continue
+        assert cost == pytest.approx(expected)
+        assert path[0] == start and path[-1] == goal
+        assert len(set(path)) == len(path)
+        assert all(sim.grid[cell] != -1 for cell in path)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from crowd_simulation import CrowdSimulation
+from replay import MoveRecorder, ReplaySimulation
+
+
+def test_replay_follows_the_recording_and_stops_cleanly(tmp_path):
+    path = str(tmp_path / "run")
+    sim = CrowdSimulation(30, 50, 0.02, forecast=False, seed=3, renderers=[MoveRecorder(path)])
+    grids = [sim.step().copy() for _ in range(6)]
+
+    replay = ReplaySimulation(path, forecast=False)
+    assert replay.steps_left == 6
+    for grid in grids:
+        assert np.array_equal(replay.step(), grid)
+    assert replay.steps_left == 0
+
+    heat = replay.cumulative_heat.copy()
+    history = len(replay.grid_history)
+    with pytest.raises(IndexError):
+        replay.step()
+    # Nothing was changed by the refused step
+    assert np.array_equal(replay.cumulative_heat, heat)
+    assert len(replay.grid_history) == history
+    assert np.array_equal(replay.grid, grids[-1])
+
+
+def test_seeded_runs_train_synchronously_with_one_model_seed():
+    seeded = CrowdSimulation(20, 10, forecast=False, seed=7)
+    assert not seeded.background_training
+    assert seeded.model_seed == CrowdSimulation(20, 10, forecast=False, seed=np.random.default_rng(7)).model_seed
+    assert CrowdSimulation(20, 10, forecast=False).background_training
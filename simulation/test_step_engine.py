@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from step_engine import neighbour_counts, step_crowd
+
+
+def crowded_grid(size, num_people, obstacle_ratio, seed):
+    rng = np.random.default_rng(seed)
+    grid = np.zeros((size, size), dtype=int)
+    cells = rng.permutation(size * size)
+    num_obstacles = int(size * size * obstacle_ratio)
+    grid.ravel()[cells[:num_obstacles]] = -1
+    people = cells[num_obstacles:num_obstacles + num_people]
+    grid.ravel()[people] = 1
+    return grid, np.column_stack(np.divmod(people, size))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('size, num_people, obstacle_ratio', [(20, 100, 0.05), (50, 100, 0.02), (30, 600, 0.1)])
+def test_step_crowd_keeps_people_apart_and_off_obstacles(seed, size, num_people, obstacle_ratio):
+    grid, people = crowded_grid(size, num_people, obstacle_ratio, seed)
+    obstacles = grid == -1
+    rng = np.random.default_rng(seed)
+
+    for _ in range(20):
+        previous = people
+        grid, people = step_crowd(grid, people, rng)
+
+        # Population is constant and every person is on its own cell
+        assert people.shape == (num_people, 2)
+        assert len({tuple(p) for p in people}) == num_people
+        assert (grid == 1).sum() == num_people
+        assert np.all(grid[people[:, 0], people[:, 1]] == 1)
+        # Nobody steps onto an obstacle, off the grid or further than one cell
+        assert np.array_equal(grid == -1, obstacles)
+        assert np.all((people >= 0) & (people < size))
+        assert np.all(np.abs(people - previous).sum(axis=1) <= 1)
+
+
+def test_step_crowd_without_people():
+    grid = np.zeros((5, 5), dtype=int)
+    new_grid, people = step_crowd(grid, np.empty((0, 2), dtype=int))
+    assert np.array_equal(new_grid, grid) and people.shape == (0, 2)
+
+
+def test_neighbour_counts():
+    grid = np.zeros((3, 3), dtype=int)
+    grid[1, 1] = 1
+    grid[0, 0] = -1
+    expected = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])
+    assert np.array_equal(neighbour_counts(grid), expected)